@@ -0,0 +1,132 @@
+# One texture for every block type. The glb block models each carry a 48x64
+# cube net (3 x 4 tiles of 16x16 pixels); their top, side and bottom tiles
+# are copied into the layers of a single 2D texture array, so a chunk mesh
+# that mixes block types is still one Geom with one render state and one
+# draw call. Greedy-meshed quads span several blocks, and the array's repeat
+# wrapping tiles each layer across them without bleeding into its
+# neighbors, which a flat atlas would need extra shader work for.
+#
+# The array is built on first use and cached to disk; the cache is rebuilt
+# whenever one of the glb files is newer than it.
+
+import os
+
+import numpy as np
+
+from panda3d.core import Filename, SamplerState, Shader, Texture
+
+from voxelworld import BLOCK_TYPES
+
+BLOCK_MODELS = tuple('%s-block.glb' % name for name in BLOCK_TYPES)
+CACHE_PATH = os.path.join('cache', 'block-textures.txo')
+
+TILE_SIZE = 16
+TOP, SIDE, BOTTOM = range(3)
+LAYERS_PER_BLOCK = 3
+# (column, row) of each face in the cube net, rows counted from the bottom
+# of the image as texture v runs
+NET_TILES = {TOP: (1, 3), SIDE: (1, 2), BOTTOM: (1, 1)}
+
+
+def blockLayer(blockId, face):
+    return (blockId - 1) * LAYERS_PER_BLOCK + face
+
+
+def netTiles(texture):
+    # The TOP, SIDE and BOTTOM tiles of a block model's texture as RGBA
+    # arrays, bottom row first
+    pixels = np.frombuffer(texture.getRamImageAs('RGBA').getData(), dtype=np.uint8)
+    pixels = pixels.reshape(texture.getYSize(), texture.getXSize(), 4)
+    tile = texture.getXSize() // 3
+    tiles = []
+    for face in (TOP, SIDE, BOTTOM):
+        column, row = NET_TILES[face]
+        image = pixels[row * tile:(row + 1) * tile, column * tile:(column + 1) * tile]
+        if tile != TILE_SIZE:
+            step = tile // TILE_SIZE
+            image = image[::step, ::step]
+        tiles.append(image)
+    return tiles
+
+
+def buildTextureArray(loader):
+    layers = []
+    for path in BLOCK_MODELS:
+        texture = loader.loadModel(path).findAllTextures()[0]
+        layers.extend(netTiles(texture))
+    array = Texture('block-textures')
+    array.setup2dTextureArray(TILE_SIZE, TILE_SIZE, len(layers), Texture.TUnsignedByte, Texture.FRgba)
+    array.setRamImageAs(np.ascontiguousarray(layers).tobytes(), 'RGBA')
+    return array
+
+
+def loadBlockTextures(loader, cachePath=CACHE_PATH):
+    newest = max(os.path.getmtime(path) for path in BLOCK_MODELS)
+    array = None
+    if os.path.exists(cachePath) and os.path.getmtime(cachePath) >= newest:
+        array = Texture('block-textures')
+        if not array.read(Filename.fromOsSpecific(cachePath)):
+            array = None
+    if array is None:
+        array = buildTextureArray(loader)
+        os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+        array.write(Filename.fromOsSpecific(cachePath))
+    # Keep the pixel-art look up close and avoid shimmer far away
+    array.setMagfilter(SamplerState.FTNearest)
+    array.setMinfilter(SamplerState.FTNearestMipmapLinear)
+    array.setWrapU(SamplerState.WMRepeat)
+    array.setWrapV(SamplerState.WMRepeat)
+    return array
+
+
+VERTEX_SHADER = """
+#version 150
+
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat3 p3d_NormalMatrix;
+
+in vec4 p3d_Vertex;
+in vec3 p3d_Normal;
+in vec3 p3d_MultiTexCoord0;
+
+out vec3 texcoord;
+out vec3 normal;
+
+void main() {
+    gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
+    texcoord = p3d_MultiTexCoord0;
+    normal = p3d_NormalMatrix * p3d_Normal;
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 150
+
+uniform sampler2DArray blockTextures;
+uniform struct p3d_LightModelParameters {
+    vec4 ambient;
+} p3d_LightModel;
+uniform struct p3d_LightSourceParameters {
+    vec4 color;
+    vec4 position;
+} p3d_LightSource[1];
+
+in vec3 texcoord;
+in vec3 normal;
+
+out vec4 fragColor;
+
+void main() {
+    vec4 base = texture(blockTextures, texcoord);
+    // The directional light's position is its direction in view space
+    float diffuse = max(dot(normalize(normal), normalize(p3d_LightSource[0].position.xyz)), 0.0);
+    vec3 light = p3d_LightModel.ambient.rgb + p3d_LightSource[0].color.rgb * diffuse;
+    fragColor = vec4(base.rgb * light, base.a);
+}
+"""
+
+
+def applyBlockState(nodePath, texture):
+    # Everything under nodePath shares the one shader and texture array
+    nodePath.setShader(Shader.make(Shader.SL_GLSL, VERTEX_SHADER, FRAGMENT_SHADER))
+    nodePath.setShaderInput('blockTextures', texture)
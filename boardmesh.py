@@ -0,0 +1,95 @@
+# The Lightbot board as one Geom: every tile stack is written into a single
+# GeomVertexData in one pass, so the whole board is one draw call. Each tile
+# owns a fixed range of rows, and recoloring a tile rewrites only those rows
+# of the color column.
+
+from panda3d.core import (
+    Geom,
+    GeomNode,
+    GeomTriangles,
+    GeomVertexData,
+    GeomVertexFormat,
+    GeomVertexWriter,
+    NodePath,
+)
+
+# Side faces per heading-like direction: neighbor offset, then the two base
+# corners of the face in counter-clockwise order seen from outside
+_SIDES = (
+    ((0, -1), (0, 0), (1, 0)),
+    ((1, 0), (1, 0), (1, 1)),
+    ((0, 1), (1, 1), (0, 1)),
+    ((-1, 0), (0, 1), (0, 0)),
+)
+
+
+class BoardMesh:
+    def __init__(self, heights, color_of):
+        # heights[x][y] as in Board.heights; color_of(x, y) gives the starting color
+        self.width = len(heights)
+        self.height = len(heights[0])
+        self.rows = {}  # (x, y) -> (first vertex row, vertex count)
+
+        faces = []
+        for x in range(self.width):
+            for y in range(self.height):
+                top = heights[x][y]
+                if not top:
+                    continue
+                tile_faces = [("top", None, top)]
+                for (dx, dy), start, end in _SIDES:
+                    nx, ny = x + dx, y + dy
+                    below = heights[nx][ny] if 0 <= nx < self.width and 0 <= ny < self.height else 0
+                    # Only the part of the side that rises above the neighbor shows
+                    if below < top:
+                        tile_faces.append(((dx, dy), (start, end), (below, top)))
+                faces.append((x, y, tile_faces))
+
+        vertex_count = sum(len(tile_faces) for x, y, tile_faces in faces) * 4
+        self.vdata = GeomVertexData("board", GeomVertexFormat.getV3n3c4(), Geom.UHStatic)
+        self.vdata.uncleanSetNumRows(vertex_count)
+        vertex = GeomVertexWriter(self.vdata, "vertex")
+        normal = GeomVertexWriter(self.vdata, "normal")
+        color = GeomVertexWriter(self.vdata, "color")
+        triangles = GeomTriangles(Geom.UHStatic)
+
+        row = 0
+        for x, y, tile_faces in faces:
+            first = row
+            tile_color = color_of(x, y)
+            for direction, corners, span in tile_faces:
+                if direction == "top":
+                    z = span
+                    quad = ((x, y, z), (x + 1, y, z), (x + 1, y + 1, z), (x, y + 1, z))
+                    face_normal = (0, 0, 1)
+                else:
+                    (ax, ay), (bx, by) = corners
+                    low, high = span
+                    quad = (
+                        (x + ax, y + ay, low), (x + bx, y + by, low),
+                        (x + bx, y + by, high), (x + ax, y + ay, high),
+                    )
+                    face_normal = (direction[0], direction[1], 0)
+                for point in quad:
+                    vertex.setData3(*point)
+                    normal.setData3(*face_normal)
+                    color.setData4(*tile_color)
+                triangles.addVertices(row, row + 1, row + 2)
+                triangles.addVertices(row, row + 2, row + 3)
+                row += 4
+            self.rows[x, y] = (first, row - first)
+
+        self.geom = Geom(self.vdata)
+        self.geom.addPrimitive(triangles)
+        geom_node = GeomNode("board")
+        geom_node.addGeom(self.geom)
+        self.node = NodePath(geom_node)
+
+    def set_tile_color(self, x, y, tile_color):
+        if (x, y) not in self.rows:
+            return
+        first, count = self.rows[x, y]
+        color = GeomVertexWriter(self.node.node().modifyGeom(0).modifyVertexData(), "color")
+        color.setRow(first)
+        for i in range(count):
+            color.setData4(*tile_color)
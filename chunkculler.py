@@ -0,0 +1,157 @@
+# Chunk visibility for main.py. Each frame the chunks that can be seen are
+# found by a breadth-first walk out from the camera's chunk (the "cave
+# culling" visibility graph): the walk only leaves a chunk through a face
+# that is joined by air to the face it came in through, never turns back
+# towards the camera, and never enters a chunk outside the lens frustum.
+# Chunk meshes the walk does not reach are stashed so the renderer skips
+# them entirely.
+#
+# Which faces of a chunk are joined by air is worked out on the mesher
+# thread whenever the chunk is re-meshed (see faceConnectivity).
+
+from collections import deque
+
+import numpy as np
+
+from panda3d.core import BoundingBox, BoundingVolume, PStatCollector, Point3
+
+from voxelworld import AIR, BLOCK_SIZE, CHUNK_SIZE, DIRECTIONS
+
+FACES = len(DIRECTIONS)  # face d of a chunk looks along DIRECTIONS[d]
+ALL_CONNECTED = (1 << FACES * FACES) - 1
+
+_statChunks = PStatCollector("Chunks:Total")
+_statVisible = PStatCollector("Chunks:Visible")
+_statFrustum = PStatCollector("Chunks:Frustum culled")
+_statOcclusion = PStatCollector("Chunks:Occlusion culled")
+
+
+def opposite(face):
+    # DIRECTIONS lists each direction right before its reverse
+    return face ^ 1
+
+
+def faceConnectivity(blocks):
+    # Bitmask with bit (a * FACES + b) set when air joins faces a and b of
+    # the chunk. Air cells are labeled with their flattened index and each
+    # takes the smallest label among its air neighbors until nothing
+    # changes, so connected air ends up sharing one label.
+    air = blocks == AIR
+    if not air.any():
+        return 0
+    if air.all():
+        return ALL_CONNECTED
+
+    solid = air.size
+    labels = np.where(air, np.arange(air.size).reshape(air.shape), solid)
+    while True:
+        spread = labels.copy()
+        for axis in range(3):
+            low = [slice(None)] * 3
+            high = [slice(None)] * 3
+            low[axis] = slice(None, -1)
+            high[axis] = slice(1, None)
+            np.minimum(spread[tuple(high)], labels[tuple(low)], out=spread[tuple(high)])
+            np.minimum(spread[tuple(low)], labels[tuple(high)], out=spread[tuple(low)])
+        spread[~air] = solid
+        if np.array_equal(spread, labels):
+            break
+        labels = spread
+
+    faceLabels = []
+    for dx, dy, dz in DIRECTIONS:
+        index = [slice(None)] * 3
+        axis = 0 if dx else 1 if dy else 2
+        index[axis] = -1 if dx + dy + dz > 0 else 0
+        faceLabels.append(set(np.unique(labels[tuple(index)]).tolist()) - {solid})
+
+    mask = 0
+    for a in range(FACES):
+        for b in range(a, FACES):
+            if faceLabels[a] & faceLabels[b]:
+                mask |= 1 << (a * FACES + b) | 1 << (b * FACES + a)
+    return mask
+
+
+def chunkBounds(key):
+    # World-space box of a chunk, matching the node placement in main.py
+    low = [(c * CHUNK_SIZE - 0.5) * BLOCK_SIZE for c in key]
+    size = CHUNK_SIZE * BLOCK_SIZE
+    return BoundingBox(Point3(*low), Point3(low[0] + size, low[1] + size, low[2] + size))
+
+
+class ChunkCuller:
+    def __init__(self):
+        self.connectivity = {}  # chunk key -> faceConnectivity mask
+        self.hidden = set()  # keys of stashed chunk nodes
+        self.stats = {"chunks": 0, "visible": 0, "frustumCulled": 0, "occlusionCulled": 0}
+
+    def setConnectivity(self, key, mask):
+        self.connectivity[key] = mask
+
+    def forget(self, key):
+        self.connectivity.pop(key, None)
+        self.hidden.discard(key)
+
+    def visibleChunks(self, cameraKey, frustum, limits):
+        # Keys reached by the visibility walk. frustum is a world-space
+        # BoundingVolume; limits is ((low key), (high key)) around every chunk
+        # that exists, so the walk never wanders off into empty space.
+        # Chunks with unknown connectivity (not yet meshed, or air) let the
+        # walk through any way, which keeps the culling conservative.
+        low, high = limits
+        visible = {cameraKey}
+        pending = deque([(cameraKey, None, 0)])
+        while pending:
+            key, entered, travelled = pending.popleft()
+            mask = self.connectivity.get(key, ALL_CONNECTED)
+            for face, (dx, dy, dz) in enumerate(DIRECTIONS):
+                # Going back the way we came can only see what is behind us
+                if travelled >> opposite(face) & 1:
+                    continue
+                if entered is not None and not mask >> (entered * FACES + face) & 1:
+                    continue
+                neighbor = (key[0] + dx, key[1] + dy, key[2] + dz)
+                if neighbor in visible:
+                    continue
+                if not all(low[a] <= neighbor[a] <= high[a] for a in range(3)):
+                    continue
+                if frustum.contains(chunkBounds(neighbor)) == BoundingVolume.IF_no_intersection:
+                    continue
+                visible.add(neighbor)
+                pending.append((neighbor, opposite(face), travelled | 1 << face))
+        return visible
+
+    def update(self, chunkNodes, cameraKey, frustum):
+        # Stashes every chunk node the camera cannot see and unstashes the
+        # rest; returns the stats dict
+        if not chunkNodes:
+            return self.stats
+        keys = list(chunkNodes) + [cameraKey]
+        low = tuple(min(key[a] for key in keys) for a in range(3))
+        high = tuple(max(key[a] for key in keys) for a in range(3))
+        visible = self.visibleChunks(cameraKey, frustum, (low, high))
+
+        frustumCulled = 0
+        for key, node in chunkNodes.items():
+            if key in visible:
+                if key in self.hidden:
+                    node.unstash()
+                    self.hidden.discard(key)
+                continue
+            if frustum.contains(chunkBounds(key)) == BoundingVolume.IF_no_intersection:
+                frustumCulled += 1
+            if key not in self.hidden:
+                node.stash()
+                self.hidden.add(key)
+
+        stats = self.stats
+        stats["chunks"] = len(chunkNodes)
+        stats["visible"] = len(chunkNodes) - len(self.hidden)
+        stats["frustumCulled"] = frustumCulled
+        stats["occlusionCulled"] = len(self.hidden) - frustumCulled
+        _statChunks.setLevel(stats["chunks"])
+        _statVisible.setLevel(stats["visible"])
+        _statFrustum.setLevel(stats["frustumCulled"])
+        _statOcclusion.setLevel(stats["occlusionCulled"])
+        return stats
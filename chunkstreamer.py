@@ -0,0 +1,135 @@
+# Streams terrain around the camera. The world is loaded in chunk columns
+# (every chunk sharing an (i, j) chunk coordinate): columns within the view
+# radius are generated on a worker thread, nearest first, and columns past the
+# radius plus a margin are dropped from the world again, so memory stays
+# bounded however far the camera travels. The margin keeps a column from
+# being loaded and unloaded over and over while the camera sits on a border.
+#
+# With a RegionStore, saved chunks replace the generated ones as a column
+# loads, and edited chunks are saved before their column is unloaded.
+
+import heapq
+import queue
+import threading
+
+from voxelworld import BLOCK_SIZE, CHUNK_SIZE
+
+VIEW_RADIUS = 4  # chunk columns
+UNLOAD_MARGIN = 1
+
+
+def columnAt(x, y):
+    # World position -> chunk column
+    span = CHUNK_SIZE * BLOCK_SIZE
+    return (int((x + BLOCK_SIZE / 2) // span), int((y + BLOCK_SIZE / 2) // span))
+
+
+def columnDistance(a, b):
+    return ((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2) ** 0.5
+
+
+class ChunkStreamer:
+    def __init__(self, world, terrain, radius=VIEW_RADIUS, margin=UNLOAD_MARGIN, store=None):
+        self.world = world
+        self.terrain = terrain
+        self.store = store
+        self.radius = radius
+        self.margin = margin
+        self.center = None
+        self.loaded = set()  # columns in the world
+        self.wanted = set()  # columns queued or being generated
+        self.pending = []  # heap of (distance from center, column)
+        self.active = None  # column the worker is generating
+        self.condition = threading.Condition()
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self.work, name="chunk-streamer", daemon=True)
+        self.thread.start()
+
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                distance, column = heapq.heappop(self.pending)
+                self.active = column
+            self.results.put((column, self.loadColumn(column)))
+            with self.condition:
+                self.active = None
+
+    def loadColumn(self, column):
+        chunks = self.terrain.generateColumn(*column)
+        if self.store is not None:
+            saved = self.store.loadColumn(*column)
+            if saved:
+                savedKeys = {key for key, blocks in saved}
+                chunks = [chunk for chunk in chunks if chunk[0] not in savedKeys] + saved
+        return chunks
+
+    def update(self, position):
+        # Called every frame with the camera position. Returns (keys of chunks
+        # to mesh, keys of chunks removed from the world). Chunks to mesh are
+        # the new ones and their neighbors, whose border faces change.
+        center = columnAt(position[0], position[1])
+        unloaded = []
+        if center != self.center:
+            self.center = center
+            unloaded = self.recenter()
+
+        changed = set()
+        while True:
+            try:
+                column, chunks = self.results.get_nowait()
+            except queue.Empty:
+                break
+            # The camera may have moved away while the column was generated
+            if column not in self.wanted:
+                continue
+            self.wanted.discard(column)
+            keys = []
+            for key, blocks in chunks:
+                self.world.setChunkBlocks(key, blocks)
+                keys.append(key)
+            self.loaded.add(column)
+            for ci, cj, ck in keys:
+                changed.add((ci, cj, ck))
+                for di, dj in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+                    if (ci + di, cj + dj, ck) in self.world.chunks:
+                        changed.add((ci + di, cj + dj, ck))
+        return list(changed), unloaded
+
+    def recenter(self):
+        # Unloads columns that fell out of range and requeues the rest by
+        # their distance to the new center
+        keep = self.radius + self.margin
+        dropped = {column for column in self.loaded if columnDistance(column, self.center) > keep}
+        self.loaded -= dropped
+        # Also catches chunks created by block edits, not only generated ones
+        unloaded = [key for key in self.world.chunks if key[:2] in dropped] if dropped else []
+        if self.store is not None and unloaded:
+            self.store.save(self.world, unloaded)
+        for key in unloaded:
+            self.world.removeChunk(key)
+
+        cx, cy = self.center
+        reach = int(self.radius)
+        for i in range(cx - reach, cx + reach + 1):
+            for j in range(cy - reach, cy + reach + 1):
+                column = (i, j)
+                if column not in self.loaded and columnDistance(column, self.center) <= self.radius:
+                    self.wanted.add(column)
+        self.wanted = {
+            column for column in self.wanted if columnDistance(column, self.center) <= keep
+        }
+
+        with self.condition:
+            self.pending = [
+                (columnDistance(column, self.center), column)
+                for column in self.wanted if column != self.active
+            ]
+            heapq.heapify(self.pending)
+            self.condition.notify()
+        return unloaded
+
+    def idle(self):
+        # True once every column in range is in the world
+        return not self.wanted
@@ -1,3 +1,4 @@
+import sys
 from direct.showbase.ShowBase import ShowBase
 from panda3d.core import Vec3, WindowProperties, CardMaker
 from direct.task import Task
@@ -5,9 +6,19 @@ from direct.gui.DirectGui import DirectButton, DirectFrame, DirectLabel
 from direct.interval.LerpInterval import LerpHprInterval
 from direct.interval.IntervalGlobal import Sequence, Func
 from direct.task.TaskManagerGlobal import taskMgr  # Ensure taskMgr is available
+from functools import partial
+from lightbotbytecode import compile_program
+from lightbotsim import OPCODES, Board, Simulation
+from lightbottrace import TraceRecorder
+
+# Timings at 1x speed; faster speeds divide them
+STEP_DELAY = 0.5  # Seconds between queued instructions
+TURN_DURATION = 0.3  # Seconds for the turn animation
+# Selectable execution speeds, None replays the whole queue in one frame
+SPEEDS = (1, 4, 16, None)
 
 class ChessboardGame(ShowBase):
-    def __init__(self):
+    def __init__(self, trace=None):
         ShowBase.__init__(self)
         wp = WindowProperties()
         wp.setSize(1600, 900)
@@ -16,15 +27,29 @@ class ChessboardGame(ShowBase):
         self.setup_scene_layout()
         self.create_chessboard()
         self.create_player()
+        # Optional binary trace of every executed instruction
+        if trace:
+            self.sim.trace = TraceRecorder(trace, self.sim)
 
         self.movement_queue = []
         self.is_executing_movements = False
+        self.speed = SPEEDS[0]
+        self.rotate_interval = None
+        # View handlers indexed by opcode, in lightbotsim.INSTRUCTIONS order
+        self.movement_actions = (
+            partial(self.move_player, "forward"),
+            partial(self.turn_player, "left"),
+            partial(self.turn_player, "right"),
+            self.jump_player,
+            self.change_color,
+        )
 
         self.createInstructionPlaceholder()
         self.createControlButtons()
 
         self.accept("enter", self.start_movement)
         self.accept("c", self.change_color)
+        self.accept("s", self.cycle_speed)
 
     def setup_scene_layout(self):
         self.disableMouse()
@@ -38,6 +63,7 @@ class ChessboardGame(ShowBase):
         background.setColor(0.7, 0.7, 0.7, 1)
 
     def create_chessboard(self):
+        self.sim = Simulation(Board(8, 8))
         self.chessboard = []
         for x in range(8):
             row = []
@@ -56,9 +82,13 @@ class ChessboardGame(ShowBase):
         self.player.setPos(0.5, 0.5, 1.5)
         self.player.reparentTo(self.render)
 
-        self.player_pos = [0, 0]
-        self.player_direction = 0
-        self.color_changed = False
+    @property
+    def player_pos(self):
+        return [self.sim.x, self.sim.y]
+
+    @property
+    def player_direction(self):
+        return self.sim.direction
 
     def createInstructionPlaceholder(self):
         aspect2d = self.aspect2d
@@ -121,6 +151,13 @@ class ChessboardGame(ShowBase):
             extraArgs=["color"],
             parent=self.aspect2d
         )
+        self.speedButton = DirectButton(
+            text=self.speed_text(),
+            pos=(0.9, 0, -0.25),
+            scale=0.07,
+            command=self.cycle_speed,
+            parent=self.aspect2d
+        )
 # Color Change Button
         self.colorButton = DirectButton(
             text="C",  # Color change button
@@ -156,75 +193,92 @@ class ChessboardGame(ShowBase):
             else:
                 label['text'] = ""
 
+    def speed_text(self):
+        return "Instant" if self.speed is None else "%dx" % self.speed
+
+    def cycle_speed(self):
+        # 1x -> 4x -> 16x -> instant -> 1x
+        self.speed = SPEEDS[(SPEEDS.index(self.speed) + 1) % len(SPEEDS)]
+        self.speedButton['text'] = self.speed_text()
+
     def start_movement(self):
         # If not already executing and queue is not empty
         if not self.is_executing_movements and self.movement_queue:
             self.is_executing_movements = True
             self.execute_next_movement()
 
-    def execute_next_movement(self):
+    def execute_next_movement(self, task=None):
         # If queue is empty, stop execution
         if not self.movement_queue:
             self.is_executing_movements = False
             return Task.done
 
+        if self.speed is None:
+            self.execute_all_movements()
+            return Task.done
+
         # Get the next movement
         movement = self.movement_queue.pop(0)
         self.update_instruction_labels()
 
         # Execute the movement based on type
-        if movement == "forward":
-            self.move_player("forward")
-        elif movement == "left":
-            self.turn_player("left")
-        elif movement == "right":
-            self.turn_player("right")
-        elif movement == "jump":
-            self.jump_player()
-        elif movement == "color":
-            self.change_color()
-
-        # Schedule next movement using a task instead of doMethodLater
-        return taskMgr.doMethodLater(0.5, self.execute_next_movement, "next_movement")
+        self.movement_actions[OPCODES[movement]]()
 
-    def move_player(self, direction):
-        x, y = self.player_pos
+        # Schedule the next movement, paced by the selected speed
+        taskMgr.doMethodLater(STEP_DELAY / self.speed, self.execute_next_movement, "next_movement")
+        return Task.done
+
+    def execute_all_movements(self):
+        # Instant mode: run the rest of the queue in the simulation and draw
+        # only the final state, skipping every animation
+        movements = self.movement_queue
+        self.movement_queue = []
+        self.update_instruction_labels()
+
+        lit_before = self.sim.lit
+        self.sim.execute(compile_program(movements))
+
+        if self.rotate_interval is not None:
+            self.rotate_interval.finish()
+            self.rotate_interval = None
+        taskMgr.remove("jump")
+        self.player.setPos(self.sim.x + 0.5, self.sim.y + 0.5, 1.5)
+        self.player.setH(self.player_direction)
+
+        height = self.sim.board.height
+        for index in self.sim.bits.tiles_in(lit_before ^ self.sim.lit):
+            self.update_tile_color(*divmod(index, height))
+
+        self.is_executing_movements = False
 
-        # Determine movement based on facing direction
+    def move_player(self, direction):
         if direction == "forward":
-            if self.player_direction == 180 and y < 7:  # Facing up
-                y += 1
-            elif self.player_direction == 90 and x < 7:  # Facing right
-                x += 1
-            elif self.player_direction == 0 and y > 0:  # Facing down
-                y -= 1
-            elif self.player_direction == 270 and x > 0:  # Facing left
-                x -= 1
-
-        self.player_pos = [x, y]
+            self.sim.step("forward")
+
+        x, y = self.player_pos
         self.player.setPos(x + 0.5, y + 0.5, 1.5)
 
     def turn_player(self, direction):
-        # Update direction based on turning
-        if direction == "left":
-            self.player_direction = (self.player_direction - 90) % 360
-        elif direction == "right":
-            self.player_direction = (self.player_direction + 90) % 360
+        if direction in ("left", "right"):
+            self.sim.step(direction)
 
         # Rotate the player visually with a smooth rotation
-        rotate_interval = LerpHprInterval(
-            self.player, 
-            0.3,  # Duration of rotation
+        if self.rotate_interval is not None:
+            self.rotate_interval.finish()
+        self.rotate_interval = LerpHprInterval(
+            self.player,
+            TURN_DURATION / self.speed,  # Duration of rotation
             Vec3(self.player_direction, 0, 0)
         )
-        rotate_interval.start()
+        self.rotate_interval.start()
 
     def jump_player(self):
         # Make the player jump
-        taskMgr.add(self.jump_task)
+        self.sim.step("jump")
+        taskMgr.add(self.jump_task, "jump")
 
     def jump_task(self, task):
-        t = task.time
+        t = task.time * (self.speed or 1)
 
         # Simple parabolic jump motion
         if t < 0.1:  # Ascend
@@ -239,14 +293,22 @@ class ChessboardGame(ShowBase):
         return Task.cont
 
     def change_color(self):
-        # Change the color of the box to red or revert to original
+        # Toggle the light on the current tile: red when lit, original color otherwise
         x, y = self.player_pos
-        if not self.color_changed:
+        self.sim.step("color")
+        self.update_tile_color(x, y)
+
+    def update_tile_color(self, x, y):
+        if self.sim.is_lit(x, y):
             self.chessboard[x][y].setColor(1, 0, 0)  # Set color to red
-            self.color_changed = True
         else:
             self.chessboard[x][y].setColor(0, 0, 0 if (x + y) % 2 == 0 else 1)  # Revert to original color
-            self.color_changed = False
 
-game = ChessboardGame()
+    def userExit(self):
+        if self.sim.trace is not None:
+            self.sim.trace.close()
+        ShowBase.userExit(self)
+
+# python deneme.py [trace file to record]
+game = ChessboardGame(trace=sys.argv[1] if len(sys.argv) > 1 else None)
 game.run()
\ No newline at end of file
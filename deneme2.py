@@ -17,6 +17,7 @@ from panda3d.core import (
     CollisionHandlerQueue,
 )
 from direct.gui.OnscreenImage import OnscreenImage
+from lightbotlevels import load_level
 
 
 class ChessboardGame(ShowBase):
@@ -30,11 +31,8 @@ class ChessboardGame(ShowBase):
         # Setup the skybox
         self.setupSkybox()
 
-        # Initialize terrain heights matrix
-        self.terrain_heights = [[1 for y in range(8)] for x in range(8)]
-        self.terrain_heights[2][3] = 2
-        self.terrain_heights[2][4] = 3
-        self.terrain_heights[5][5] = 2
+        # Initialize terrain heights matrix from levels/terrain.json
+        self.terrain_heights = load_level("terrain").board.heights
 
         # Create the chessboard with varying heights
         self.chessboard = []
@@ -0,0 +1,92 @@
+# Vectorized grading of many Lightbot programs against one board. Every
+# program is a row in the NumPy state arrays, so each instruction column is
+# applied to the whole batch at once instead of looping per program and step.
+# Moves are a gather from the level's transition table, the same one
+# Simulation uses.
+
+import numpy as np
+
+from lightbotbytecode import compile_program, is_straight_line
+from lightbotsim import COLOR, HEADINGS
+from lightbottransitions import MOVE_ACTIONS
+
+# Filler for programs shorter than the longest one in the batch
+PAD = 255
+
+_DEGREES = np.array(HEADINGS, dtype=np.int16)
+
+
+def encode_programs(programs):
+    # Instruction queues ("forward", "left", ...) or opcode sequences -> padded uint8 matrix
+    codes = [compile_program(program) for program in programs]
+    length = max((len(code) for code in codes), default=0)
+    matrix = np.full((len(codes), length), PAD, dtype=np.uint8)
+    for row, code in enumerate(codes):
+        # Calls and loops branch per program, which a lockstep batch can't do
+        if not is_straight_line(code):
+            raise ValueError("program %d uses procedures or loops; run it with interpret()" % row)
+        if code:
+            matrix[row, :len(code)] = np.frombuffer(code, dtype=np.uint8)
+    return matrix
+
+
+class BatchResult:
+    def __init__(self, board, x, y, heading, lit):
+        self.board = board
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.lit = lit  # one row of per-tile flags per program
+        goals = sorted(board.goals)
+        if goals:
+            self.solved = lit[:, goals].all(axis=1)
+        else:
+            self.solved = np.ones(len(x), dtype=bool)
+
+    @property
+    def direction(self):
+        return _DEGREES[self.heading]
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, row):
+        height = self.board.height
+        return {
+            "pose": [int(self.x[row]), int(self.y[row]), HEADINGS[self.heading[row]]],
+            "lit": [list(divmod(int(i), height)) for i in np.flatnonzero(self.lit[row])],
+            "solved": bool(self.solved[row]),
+        }
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+
+def evaluate_batch(board, programs):
+    if isinstance(programs, np.ndarray):
+        matrix = programs
+    else:
+        matrix = encode_programs(programs)
+    count = matrix.shape[0]
+
+    start_x, start_y, direction = board.start
+    table = board.transitions.as_array()
+    pose = np.full(count, board.index(start_x, start_y) << 2 | HEADINGS.index(direction % 360), dtype=np.int32)
+    lit = np.zeros((count, board.width * board.height), dtype=bool)
+    rows = np.arange(count)
+
+    for column in matrix.T:
+        moving = column < MOVE_ACTIONS
+        if moving.any():
+            # Rows not moving this column (color or padding) look up a
+            # harmless action and keep their pose
+            action = np.where(moving, column, 0).astype(np.int32)
+            pose = np.where(moving, table[pose << 2 | action], pose)
+
+        lighting = column == COLOR
+        if lighting.any():
+            lit[rows[lighting], pose[lighting] >> 2] ^= True
+
+    x, y = np.divmod(pose >> 2, board.height)
+    return BatchResult(board, x, y, pose & 3, lit)
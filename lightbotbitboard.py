@@ -0,0 +1,71 @@
+# Bitboard layer for Lightbot boards. Tile i (i = x * height + y, the same
+# numbering as chessboard[x][y]) is bit i of a Python int, so an 8x8 board
+# fits in 64 bits; larger boards just use wider ints.
+
+
+class Bitboard:
+    def __init__(self, width, height, heights, goals):
+        self.width = width
+        self.height = height
+        self.tiles = width * height
+        self.full = (1 << self.tiles) - 1
+
+        # heights[i] is the stack height of tile i, 0 meaning there is no tile
+        self.heights = heights
+        self.goals = 0
+        for index in goals:
+            self.goals |= 1 << index
+
+        # planes[h] holds every tile of height h; walkable is any tile at all
+        self.planes = [0] * (max(heights, default=0) + 1)
+        for index, level in enumerate(heights):
+            self.planes[level] |= 1 << index
+        self.walkable = self.full & ~self.planes[0]
+
+        # Per heading (0, 90, 180, 270): tiles that have a neighbor that way,
+        # and the index offset to reach it
+        column = (1 << height) - 1
+        bottom_row = 0
+        for x in range(width):
+            bottom_row |= 1 << (x * height)
+        top_row = bottom_row << (height - 1)
+        self.exits = (
+            self.full & ~bottom_row,  # 0: towards -y
+            self.full & ~(column << (width - 1) * height),  # 90: towards +x
+            self.full & ~top_row,  # 180: towards +y
+            self.full & ~column,  # 270: towards -x
+        )
+        self.offsets = (-1, height, 1, -height)
+
+    def neighbor(self, index, heading):
+        # Index of the tile in front, or -1 off the edge of the board
+        if self.exits[heading] >> index & 1:
+            return index + self.offsets[heading]
+        return -1
+
+    def can_walk(self, index, heading):
+        # Forward needs a tile of the same height in front
+        target = self.neighbor(index, heading)
+        return target >= 0 and self.planes[self.heights[index]] >> target & 1
+
+    def can_jump(self, index, heading):
+        # Jumping goes one level up or any number of levels down
+        target = self.neighbor(index, heading)
+        if target < 0 or not self.walkable >> target & 1:
+            return False
+        level = self.heights[index]
+        return self.heights[target] == level + 1 or self.heights[target] < level
+
+    def solved(self, lit):
+        return lit & self.goals == self.goals
+
+    def unlit_goals(self, lit):
+        return bin(self.goals & ~lit).count("1")
+
+    def tiles_in(self, mask):
+        indices = []
+        while mask:
+            low = mask & -mask
+            indices.append(low.bit_length() - 1)
+            mask ^= low
+        return indices
@@ -0,0 +1,319 @@
+# Compiles instruction queues ("forward", "left", ...) into one byte per
+# instruction, the opcodes from lightbotsim. Compiled programs run through
+# Simulation.execute, or interpret() once they use procedures or loops, and
+# have a stable serialized form for storage and hashing:
+#
+#   b"LBC" + version byte + opcodes
+#
+# The version byte is 1 for programs made only of actions, as it was before
+# procedures and loops existed, so their hashes never change; code with
+# control opcodes is written as version 2.
+#
+# A program is either a plain instruction list (the main procedure) or a dict
+# {"main": [...], "p1": [...], "p2": [...]}. Inside any of them "p1" and "p2"
+# call a procedure, and {"repeat": n, "body": [...]} runs a body n times.
+#
+# Control flow is compiled to extra opcodes, with 16-bit little-endian
+# absolute offsets. main starts at offset 0 and every procedure ends in
+# RETURN; plain lists without calls or loops compile to actions only.
+#
+#   CALL lo hi      push the return address and jump to a procedure
+#   RETURN          pop the return address, or halt when the stack is empty
+#   REPEAT n        run the following body n times
+#   NEXT lo hi      end of a REPEAT body starting at the given offset
+
+import hashlib
+from array import array
+from collections import OrderedDict
+
+from lightbotsim import COLOR, INSTRUCTIONS, OPCODES
+
+MAGIC = b"LBC"
+VERSION = 2
+ACTIONS_VERSION = 1  # actions only; keeps hashes of straight-line programs stable
+
+CALL, RETURN, REPEAT, NEXT = range(len(INSTRUCTIONS), len(INSTRUCTIONS) + 4)
+OPERAND_SIZES = (0,) * len(INSTRUCTIONS) + (2, 0, 1, 2)
+PROCEDURES = ("main", "p1", "p2")
+CACHE_SIZE = 4096  # procedure effects kept per interpret() run
+
+# interpret() results
+HALTED = "halted"
+OUT_OF_STEPS = "out_of_steps"
+CYCLE = "cycle"
+STACK_OVERFLOW = "stack_overflow"
+
+
+def _emit(code, body, calls):
+    for op in body:
+        if op.__class__ is int and 0 <= op < len(INSTRUCTIONS):
+            code.append(op)
+        elif op.__class__ is str and op in OPCODES:
+            code.append(OPCODES[op])
+        elif op.__class__ is str and op in PROCEDURES[1:]:
+            calls.append((len(code) + 1, op))
+            code.extend((CALL, 0, 0))
+        elif isinstance(op, dict) and "repeat" in op:
+            count = op["repeat"]
+            if not 0 <= count <= 255:
+                raise ValueError("repeat count %r out of range" % count)
+            if count:
+                code.extend((REPEAT, count))
+                start = len(code)
+                _emit(code, op.get("body", ()), calls)
+                code.extend((NEXT, start & 0xFF, start >> 8))
+        else:
+            raise ValueError("unknown instruction %r" % (op,))
+
+
+def compile_program(program):
+    # Instruction list or procedure dict -> array('B') bytecode
+    if isinstance(program, array):
+        return program
+    procedures = program if isinstance(program, dict) else {"main": program}
+    for name in procedures:
+        if name not in PROCEDURES:
+            raise ValueError("unknown procedure %r" % name)
+
+    code = array("B")
+    calls = []
+    entries = {}
+    for name in PROCEDURES:
+        if name == "main" or name in procedures:
+            entries[name] = len(code)
+            _emit(code, procedures.get(name, ()), calls)
+            code.append(RETURN)
+
+    # Straight-line programs keep their one-byte-per-action form
+    if not calls and max(code) == RETURN and code.count(RETURN) == 1:
+        code.pop()
+
+    for position, name in calls:
+        if name not in entries:
+            raise ValueError("call to undefined procedure %r" % name)
+        code[position] = entries[name] & 0xFF
+        code[position + 1] = entries[name] >> 8
+    if len(code) > 0xFFFF:
+        raise ValueError("program too long")
+    return code
+
+
+def is_straight_line(code):
+    # True when the code only holds actions, so Simulation.execute can run it
+    return not code or max(code) < len(INSTRUCTIONS)
+
+
+def _validate(code):
+    pc = 0
+    while pc < len(code):
+        opcode = code[pc]
+        if opcode >= len(OPERAND_SIZES):
+            raise ValueError("invalid opcode %d" % opcode)
+        if opcode == CALL or opcode == NEXT:
+            if pc + 2 >= len(code) or code[pc + 1] | code[pc + 2] << 8 >= len(code):
+                raise ValueError("jump target out of range at %d" % pc)
+        pc += 1 + OPERAND_SIZES[opcode]
+    if pc != len(code):
+        raise ValueError("truncated operand")
+    if not is_straight_line(code) and code[-1] != RETURN:
+        raise ValueError("procedure without RETURN")
+
+
+def _decompile_body(code, pc, names):
+    body = []
+    while pc < len(code):
+        opcode = code[pc]
+        if opcode == RETURN or opcode == NEXT:
+            return body, pc + 1 + OPERAND_SIZES[opcode]
+        if opcode == CALL:
+            body.append(names[code[pc + 1] | code[pc + 2] << 8])
+            pc += 3
+        elif opcode == REPEAT:
+            inner, end = _decompile_body(code, pc + 2, names)
+            body.append({"repeat": code[pc + 1], "body": inner})
+            pc = end
+        else:
+            body.append(INSTRUCTIONS[opcode])
+            pc += 1
+    return body, pc
+
+
+def decompile(code):
+    # Back to instruction lists; procedures come back as p1, p2 in code order
+    if is_straight_line(code):
+        return [INSTRUCTIONS[opcode] for opcode in code]
+
+    starts = [0]
+    pc = 0
+    while pc < len(code):
+        if code[pc] == RETURN and pc + 1 < len(code):
+            starts.append(pc + 1)
+        pc += 1 + OPERAND_SIZES[code[pc]]
+    names = dict(zip(starts, PROCEDURES))
+
+    procedures = {}
+    for start in starts:
+        procedures[names[start]], end = _decompile_body(code, start, names)
+    return procedures
+
+
+def serialize(code):
+    code = compile_program(code)
+    version = ACTIONS_VERSION if is_straight_line(code) else VERSION
+    return MAGIC + bytes((version,)) + code.tobytes()
+
+
+def deserialize(data):
+    if data[:3] != MAGIC:
+        raise ValueError("not a compiled Lightbot program")
+    # Version 1 holds actions only, which version 2 reads unchanged
+    if data[3] not in (ACTIONS_VERSION, VERSION):
+        raise ValueError("unsupported bytecode version %d" % data[3])
+    code = array("B", data[4:])
+    _validate(code)
+    if data[3] == ACTIONS_VERSION and not is_straight_line(code):
+        raise ValueError("version %d bytecode holds actions only" % ACTIONS_VERSION)
+    return code
+
+
+def program_hash(program):
+    return hashlib.sha1(serialize(program)).hexdigest()
+
+
+class ProcedureCache:
+    # Bounded LRU table of procedure call effects for interpret(), keyed by
+    # (procedure offset, entry pose). No instruction reads the lit tiles, so
+    # the pose alone decides what a call does, and color only ever flips
+    # tiles: the effect is (exit pose, XOR of lit tiles, interpreter steps,
+    # actions, extra call depth) whatever was lit before. Entries belong to
+    # one compiled program on one board; only share a cache between runs of
+    # the same pair.
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.effects = OrderedDict()
+        self.hits = 0
+
+    def get(self, key):
+        effect = self.effects.get(key)
+        if effect is not None:
+            self.effects.move_to_end(key)
+        return effect
+
+    def put(self, key, effect):
+        if not self.maxsize:
+            return
+        self.effects[key] = effect
+        self.effects.move_to_end(key)
+        if len(self.effects) > self.maxsize:
+            self.effects.popitem(last=False)
+
+
+def interpret(sim, code, max_steps=100000, max_depth=1000, cache=None, trace=None):
+    # Runs code with procedure calls and loops on sim, stopping after
+    # max_steps instructions or max_depth nested calls. A call that repeats an
+    # earlier (simulation state, target, stacks) combination can never halt,
+    # so it is reported as a cycle straight away. Returns the status.
+    #
+    # A call made again from the same pose applies its cached effect instead
+    # of running the body (see ProcedureCache), as long as the step and depth
+    # budgets would not have run out inside it. A run that halts, runs out of
+    # steps or overflows ends exactly as it would without the cache; a cycle
+    # can be noticed a few calls later, since skipped bodies add no states.
+    #
+    # trace is a lightbottrace.TraceRecorder that gets every action, by
+    # default sim.trace. Cached effects would skip actions, so tracing turns
+    # the cache off.
+    if trace is None:
+        trace = sim.trace
+    if trace is not None:
+        cache = ProcedureCache(0)
+    elif cache is None:
+        cache = ProcedureCache()
+    table = sim.table
+    first_control = CALL
+    end = len(code)
+    calls = []  # return addresses
+    loops = []  # remaining iterations of the open REPEAT bodies
+    # Per frame (the first one being main's): calls being recorded for the
+    # cache that finish when the frame returns, and the deepest the call
+    # stack has been while it was open
+    records = [[]]
+    peaks = [0]
+    seen = set()
+    pc = 0
+    steps = 0
+    status = HALTED
+
+    while pc < end:
+        if steps >= max_steps:
+            status = OUT_OF_STEPS
+            break
+        opcode = code[pc]
+        steps += 1
+        if opcode < first_control:
+            # Actions go straight to the transition table (see Simulation)
+            if opcode == COLOR:
+                sim.lit ^= 1 << (sim.pose >> 2)
+            else:
+                sim.pose = table[sim.pose << 2 | opcode]
+            sim.steps += 1
+            if trace is not None:
+                trace.record(steps, opcode, sim.pose)
+            pc += 1
+        elif opcode == CALL:
+            target = code[pc + 1] | code[pc + 2] << 8
+            # A call right before RETURN reuses the caller's frame
+            tail = code[pc + 3] == RETURN
+            depth = len(calls)
+            effect = cache.get((target, sim.pose))
+            if effect is not None:
+                pose, flipped, used, actions, extra = effect
+                if steps + used <= max_steps and depth + extra <= max_depth:
+                    cache.hits += 1
+                    if depth + extra > peaks[-1]:
+                        peaks[-1] = depth + extra
+                    sim.pose = pose
+                    sim.lit ^= flipped
+                    sim.steps += actions
+                    # A tail call's own RETURN is the caller's, run next
+                    steps += used - 1 if tail else used
+                    pc += 3
+                    continue
+            if not tail:
+                if depth >= max_depth:
+                    status = STACK_OVERFLOW
+                    break
+                calls.append(pc + 3)
+                records.append([])
+                peaks.append(depth + 1)
+            key = (sim.state, target, tuple(calls), tuple(loops))
+            if key in seen:
+                status = CYCLE
+                break
+            seen.add(key)
+            records[-1].append((target, sim.pose, sim.lit, steps, sim.steps, depth))
+            pc = target
+        elif opcode == RETURN:
+            if not calls:
+                break
+            pc = calls.pop()
+            peak = peaks.pop()
+            for target, pose, lit, entry_steps, entry_actions, depth in records.pop():
+                cache.put((target, pose), (
+                    sim.pose, sim.lit ^ lit, steps - entry_steps,
+                    sim.steps - entry_actions, peak - depth,
+                ))
+            if peak > peaks[-1]:
+                peaks[-1] = peak
+        elif opcode == REPEAT:
+            loops.append(code[pc + 1])
+            pc += 2
+        else:
+            # NEXT: jump back to the body until its count runs out
+            loops[-1] -= 1
+            if loops[-1]:
+                pc = code[pc + 1] | code[pc + 2] << 8
+            else:
+                loops.pop()
+                pc += 3
+    return status
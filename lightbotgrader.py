@@ -0,0 +1,198 @@
+# Grades a JSONL file of {"level": ..., "program": [...]} submissions on all
+# cores. The level is either an inline board dict or the name of a level in
+# levels/.
+# Lines are shipped to worker processes in chunks, each chunk is graded with
+# the batch evaluator, and results are written back in input order.
+# Programs using procedures or loops (see lightbotbytecode) go through the
+# bounded interpreter instead. Each result carries the submission's "id", or
+# its line number in the input; a submission that can't be parsed, compiled
+# or matched to a level gets {"status": "error", "error": ...} instead.
+#
+#   python lightbotgrader.py submissions.jsonl -o results.jsonl
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from lightbotbatch import evaluate_batch
+from lightbotbytecode import HALTED, compile_program, interpret, is_straight_line
+from lightbotlevels import LEVELS_DIR, load_level
+from lightbotsim import Board, Simulation
+
+ERROR = "error"  # status of submissions that could not be graded
+
+
+def run_structured(board, code):
+    # Programs with procedures or loops branch per program, so they go through
+    # the bounded interpreter one at a time instead of the batch
+    sim = Simulation(board)
+    status = interpret(sim, code)
+    return {
+        "pose": list(sim.placement),
+        "lit": [list(tile) for tile in sim.lit_tiles()],
+        "solved": sim.solved,
+        "status": status,
+    }
+
+
+def error_result(error):
+    # Stands in for the result of a submission that could not be graded, so
+    # one bad line never stops the rest of the run
+    return {"status": ERROR, "error": str(error)}
+
+
+def grade_group(board, submissions):
+    # Results for submissions that all use board, in the same order.
+    # Straight-line programs are evaluated together as one batch.
+    results = [None] * len(submissions)
+    batch = []
+    codes = []
+    for row, submission in enumerate(submissions):
+        try:
+            code = compile_program(submission["program"])
+        except (KeyError, TypeError, ValueError) as error:
+            results[row] = error_result(error)
+            continue
+        if is_straight_line(code):
+            batch.append(row)
+            codes.append(code)
+        else:
+            results[row] = run_structured(board, code)
+    graded = evaluate_batch(board, codes)
+    for i, row in enumerate(batch):
+        results[row] = graded[i]
+        results[row]["status"] = HALTED
+    return results
+
+
+def load_board(level):
+    # Named levels come from the cached loader, inline ones are built here.
+    # A submission may only name a level in LEVELS_DIR: the file paths and
+    # pack references load_level also takes are for the command line.
+    if not isinstance(level, str):
+        return Board.from_dict(level)
+    if (
+        level != os.path.basename(level) or level.startswith(".") or level.endswith(".json") or ".lbp:" in level
+        or not os.path.isfile(os.path.join(LEVELS_DIR, level + ".json"))
+    ):
+        raise ValueError("unknown level %r" % level)
+    return load_level(level).board
+
+
+def grade_lines(lines):
+    # Runs inside a worker on (line number, line) pairs: parse, group by level
+    # so each board is built once, then evaluate every group as one batch
+    results = [None] * len(lines)
+    submissions = [None] * len(lines)
+    groups = {}
+    for row, (number, line) in enumerate(lines):
+        try:
+            submission = submissions[row] = json.loads(line)
+            level = submission["level"]
+        except (KeyError, TypeError, ValueError) as error:
+            results[row] = error_result(error)
+            continue
+        key = level if isinstance(level, str) else json.dumps(level, sort_keys=True)
+        groups.setdefault(key, []).append(row)
+
+    for key, rows in groups.items():
+        # A level that can't be loaded or graded fails its own group only
+        try:
+            board = load_board(submissions[rows[0]]["level"])
+            graded = grade_group(board, [submissions[row] for row in rows])
+        except (OSError, KeyError, TypeError, ValueError) as error:
+            for row in rows:
+                results[row] = error_result(error)
+            continue
+        for row, result in zip(rows, graded):
+            results[row] = result
+    for row, result in enumerate(results):
+        submission = submissions[row]
+        number = lines[row][0]
+        result["id"] = submission.get("id", number) if isinstance(submission, dict) else number
+    return [json.dumps(result) for result in results]
+
+
+def numbered_lines(file):
+    # (line number, line) for every non-blank line, read lazily. Blank lines
+    # are still counted, so default ids are the submissions' real line numbers.
+    for number, line in enumerate(file):
+        if line.strip():
+            yield number, line
+
+
+def read_chunks(file, chunk_size):
+    # Chunks of (line number, line) pairs
+    chunk = []
+    for numbered in numbered_lines(file):
+        chunk.append(numbered)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_in_pool(function, tasks, workers=None, initializer=None, initargs=()):
+    # Calls function(task) for every task on worker processes and yields the
+    # items of each returned list in task order. Only a bounded number of
+    # tasks are in flight, so memory does not grow with the input. Closing
+    # the generator cancels the tasks that have not started.
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        pending = deque()
+        try:
+            for task in tasks:
+                pending.append(executor.submit(function, task))
+                if len(pending) >= workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def grade_stream(file, workers=None, chunk_size=2048):
+    # Graded lines in the same order they were read
+    return run_in_pool(grade_lines, read_chunks(file, chunk_size), workers)
+
+
+def run_cli(parser, grade, argv=None):
+    # Command line shared by the graders: adds the input, output and worker
+    # arguments to parser, writes the lines grade(file, args) yields as they
+    # come and reports the throughput
+    parser.add_argument("input", help="JSONL file of {level, program} submissions")
+    parser.add_argument("-o", "--output", help="where to write results (default: stdout)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    start = time.perf_counter()
+    graded = 0
+    try:
+        with open(args.input) as file:
+            for line in grade(file, args):
+                output.write(line + "\n")
+                graded += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    rate = graded / elapsed if elapsed > 0 else 0.0
+    print(f"graded {graded} programs in {elapsed:.2f}s ({rate:,.0f} programs/sec)", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade Lightbot programs from a JSONL file")
+    parser.add_argument("--chunk-size", type=int, default=2048, help="submissions per worker task")
+    run_cli(parser, lambda file, args: grade_stream(file, args.workers, args.chunk_size), argv)
+
+
+if __name__ == "__main__":
+    main()
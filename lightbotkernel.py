@@ -1,9 +1,17 @@
+import sys
+
 from direct.showbase.ShowBase import ShowBase
 from panda3d.core import Vec3
 from direct.task import Task
+from boardmesh import BoardMesh
+from lightbotlevels import load_level
+from lightbotsim import Simulation
+from lightbottrace import TraceRecorder
+
+LEVEL = "kernel"  # levels/kernel.json
 
 class ChessboardGame(ShowBase):
-    def __init__(self):
+    def __init__(self, level=LEVEL, trace=None):
         ShowBase.__init__(self)
 
         self.disableMouse()  # Disable the default camera controls
@@ -13,18 +21,16 @@ class ChessboardGame(ShowBase):
         # Setup the skybox
         self.setupSkybox()  # Ensure the skybox is set up during initialization
 
-        # Create the chessboard
-        self.chessboard = []
-        for x in range(8):
-            row = []
-            for y in range(8):
-                cube = self.loader.loadModel("models/box")
-                cube.setScale(1, 1, 1)  # size
-                cube.setPos(x, y, 0)
-                cube.setColor(0, 0, 0 if (x + y) % 2 == 0 else 1)  # Black for black boxes, Blue for blue boxes
-                cube.reparentTo(self.render)
-                row.append(cube)
-            self.chessboard.append(row)
+        # Game rules live in the headless simulation; this class only draws it
+        self.level = load_level(level)
+        self.sim = Simulation(self.level.board)
+        # Optional binary trace of every move, for replaying a session later
+        if trace:
+            self.sim.trace = TraceRecorder(trace, self.sim)
+
+        # Create the chessboard as one mesh, one box stack per tile (none for holes)
+        self.chessboard = BoardMesh(self.level.board.heights, self.tile_color)
+        self.chessboard.node.reparentTo(self.render)
 
         # Create the player sphere
         self.player = self.loader.loadModel("models/smiley")
@@ -32,9 +38,7 @@ class ChessboardGame(ShowBase):
         self.player.setPos(0.5, 0.5, 1.5)  # Slightly above the board
         self.player.reparentTo(self.render)
 
-        self.player_pos = [0, 0]  # Initial position on the board
-        self.player_direction = 0  # Facing "up" initially (0 degrees)
-        self.color_changed = False  # Track if the color has been changed
+        self.sync_player()
 
         # Accept key inputs for movement
         self.accept("arrow_up", self.move_player, ["forward"])
@@ -43,61 +47,86 @@ class ChessboardGame(ShowBase):
         self.accept("space", self.jump_player)
         self.accept("enter", self.change_color)  # Accept Enter key to change color
 
-    def move_player(self, direction):
+    @property
+    def player_pos(self):
+        return [self.sim.x, self.sim.y]
+
+    @property
+    def player_direction(self):
+        return self.sim.direction
+
+    @property
+    def player_z(self):
+        # Resting height, half a unit above the top of the current stack
         x, y = self.player_pos
+        return self.level.board.heights[x][y] + 0.5
+
+    def show_step(self, reader, step):
+        # Puts the board in the state a lightbottrace.TraceReader recorded at step
+        reader.seek(self.sim, step)
+        self.sync_player()
+        board = self.level.board
+        for x in range(board.width):
+            for y in range(board.height):
+                self.update_tile_color(x, y)
+
+    def userExit(self):
+        if self.sim.trace is not None:
+            self.sim.trace.close()
+        ShowBase.userExit(self)
+
+    def sync_player(self):
+        x, y = self.player_pos
+        self.player.setPos(x + 0.5, y + 0.5, self.player_z)
+        self.player.setH(self.player_direction)
 
-        # Determine movement based on facing direction
+    def move_player(self, direction):
         if direction == "forward":
-            if self.player_direction == 180 and y < 7:  # Facing up
-                y += 1
-            elif self.player_direction == 90 and x < 7:  # Facing right
-                x += 1
-            elif self.player_direction == 0 and y > 0:  # Facing down
-                y -= 1
-            elif self.player_direction == 270 and x > 0:  # Facing left
-                x -= 1
-
-        self.player_pos = [x, y]
-        self.player.setPos(x + 0.5, y + 0.5, 1.5)
+            self.sim.step("forward")
+        self.sync_player()
 
     def turn_player(self, direction):
-        # Update direction based on turning
-        if direction == "left":
-            self.player_direction = (self.player_direction - 90) % 360
-        elif direction == "right":
-            self.player_direction = (self.player_direction + 90) % 360
+        if direction in ("left", "right"):
+            self.sim.step(direction)
 
         # Rotate the player visually
         self.player.setH(self.player_direction)
 
     def jump_player(self):
         # Make the player jump
+        self.sim.step("jump")
+        self.sync_player()
         self.taskMgr.add(self.jump_task)
 
     def jump_task(self, task):
         t = task.time
+        base = self.player_z
 
         # Simple parabolic jump motion
         if t < 0.1:  # Ascend
-            z = 1.5 + 2 * t
+            z = base + 2 * t
         elif t < 0.5:  # Descend
-            z = 1.5 - 2 * (t - 1.5)
+            z = base - 2 * (t - 1.5)
         else:
-            self.player.setZ(1.5)  # Land back on the board
+            self.player.setZ(base)  # Land back on the board
             return Task.done
 
         self.player.setZ(z)
         return Task.cont
 
     def change_color(self):
-        # Change the color of the box to red or revert to original
+        # Toggle the light on the current tile: red when lit, original color otherwise
         x, y = self.player_pos
-        if not self.color_changed:
-            self.chessboard[x][y].setColor(1, 0, 0)  # Set color to red
-            self.color_changed = True
-        else:
-            self.chessboard[x][y].setColor(0, 0, 0 if (x + y) % 2 == 0 else 1)  # Revert to original color (black for black boxes, blue for blue boxes)
-            self.color_changed = False
+        self.sim.step("color")
+        self.update_tile_color(x, y)
+
+    def tile_color(self, x, y):
+        if self.sim.is_lit(x, y):
+            return (1, 0, 0, 1)  # Red
+        return (0, 0, 0 if (x + y) % 2 == 0 else 1, 1)  # Black for black boxes, blue for blue boxes
+
+    def update_tile_color(self, x, y):
+        self.chessboard.set_tile_color(x, y, self.tile_color(x, y))
 
     def setupSkybox(self):
         skybox = self.loader.loadModel('skybox/skybox.egg')  # Use self.loader to load the model
@@ -107,5 +136,6 @@ class ChessboardGame(ShowBase):
         skybox.setLightOff()
         skybox.reparentTo(self.render)  # Use self.render to reparent the skybox
 
-game = ChessboardGame()
+# python lightbotkernel.py [trace file to record]
+game = ChessboardGame(trace=sys.argv[1] if len(sys.argv) > 1 else None)
 game.run()
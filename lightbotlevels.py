@@ -0,0 +1,183 @@
+# Lightbot level files and a cached loader.
+#
+# A level is a JSON file in levels/ (heights, goal tiles, start pose and
+# instruction limits):
+#
+#   {"name": "terrain", "width": 8, "height": 8, "heights": [[1, ...], ...],
+#    "goals": [[2, 4], ...], "start": [0, 0, 0], "limits": {"main": 12, "p1": 8}}
+#
+# For grading farms many levels can be packed into one binary file that is
+# memory-mapped and decoded one level at a time:
+#
+#   b"LBP" + version byte + count (uint32) + (count + 1) uint32 record offsets
+#   record: width, height, start x, start y, heading index, main/p1/p2 limits,
+#           name length (all uint8), name, heights (width * height bytes),
+#           goal bitmask (little-endian, ceil(width * height / 8) bytes)
+#
+#   python lightbotlevels.py levels/*.json -o levels.lbp
+
+import argparse
+import json
+import mmap
+import os
+import struct
+from array import array
+from functools import lru_cache
+
+from lightbotsim import HEADINGS, Board
+
+LEVELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "levels")
+PACK_MAGIC = b"LBP"
+PACK_VERSION = 1
+CACHE_SIZE = 1024
+
+_HEADER = struct.Struct("<3sBI")
+_RECORD = struct.Struct("<9B")
+LIMIT_NAMES = ("main", "p1", "p2")
+
+
+class Level:
+    def __init__(self, name, board, limits=None):
+        self.name = name
+        self.board = board
+        self.limits = dict(limits or {})  # slots per procedure; missing means unlimited
+
+    def slots(self, body):
+        # A repeat takes one slot plus its body
+        count = 0
+        for op in body:
+            count += 1
+            if isinstance(op, dict):
+                count += self.slots(op.get("body", ()))
+        return count
+
+    def fits(self, program):
+        procedures = program if isinstance(program, dict) else {"main": program}
+        return all(
+            name not in self.limits or self.slots(body) <= self.limits[name]
+            for name, body in procedures.items()
+        )
+
+    def to_dict(self):
+        data = {"name": self.name}
+        data.update(self.board.to_dict())
+        if self.limits:
+            data["limits"] = self.limits
+        return data
+
+    @classmethod
+    def from_dict(cls, data, name=None):
+        return cls(data.get("name", name), Board.from_dict(data), data.get("limits"))
+
+
+class LevelPack:
+    def __init__(self, path, cache_size=CACHE_SIZE):
+        self.path = path
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = _HEADER.unpack_from(self.data, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise ValueError("%s is not a level pack" % path)
+        self.offsets = array("I")
+        self.offsets.frombytes(self.data[_HEADER.size:_HEADER.size + 4 * (count + 1)])
+        self.names = None
+        self.level = lru_cache(maxsize=cache_size)(self.decode)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.level(index)
+
+    def index_of(self, name):
+        # Name -> record index, built on first lookup by name only
+        if self.names is None:
+            self.names = {}
+            for index, offset in enumerate(self.offsets[:-1]):
+                size = self.data[offset + _RECORD.size - 1]
+                start = offset + _RECORD.size
+                self.names[self.data[start:start + size].decode()] = index
+        return self.names[name]
+
+    def get(self, name):
+        return self.level(self.index_of(name))
+
+    def decode(self, index):
+        offset = self.offsets[index]
+        width, height, x, y, heading, main, p1, p2, size = _RECORD.unpack_from(self.data, offset)
+        offset += _RECORD.size
+        name = self.data[offset:offset + size].decode()
+        offset += size
+        tiles = width * height
+        flat = self.data[offset:offset + tiles]
+        offset += tiles
+        goal_bits = int.from_bytes(self.data[offset:offset + (tiles + 7) // 8], "little")
+
+        heights = [list(flat[column * height:(column + 1) * height]) for column in range(width)]
+        goals = [divmod(i, height) for i in range(tiles) if goal_bits >> i & 1]
+        limits = {key: value for key, value in zip(LIMIT_NAMES, (main, p1, p2)) if value}
+        board = Board(width, height, goals, (x, y, HEADINGS[heading]), heights)
+        return Level(name, board, limits)
+
+    def close(self):
+        self.data.close()
+
+
+def encode_level(level):
+    board = level.board
+    x, y, direction = board.start
+    name = level.name.encode()
+    header = _RECORD.pack(
+        board.width, board.height, x, y, HEADINGS.index(direction % 360),
+        *[level.limits.get(key, 0) for key in LIMIT_NAMES], len(name),
+    )
+    heights = bytes(h for column in board.heights for h in column)
+    tiles = board.width * board.height
+    return header + name + heights + board.bits.goals.to_bytes((tiles + 7) // 8, "little")
+
+
+def write_pack(path, levels):
+    records = [encode_level(level) for level in levels]
+    offsets = array("I")
+    offset = _HEADER.size + 4 * (len(records) + 1)
+    for record in records:
+        offsets.append(offset)
+        offset += len(record)
+    offsets.append(offset)
+    with open(path, "wb") as file:
+        file.write(_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(records)))
+        file.write(offsets.tobytes())
+        for record in records:
+            file.write(record)
+
+
+@lru_cache(maxsize=64)
+def open_pack(path):
+    return LevelPack(path)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def load_level(name):
+    # "terrain" -> levels/terrain.json, "some/file.json" -> that file,
+    # "pack.lbp:terrain" or "pack.lbp:3" -> a level from a pack
+    if ".lbp:" in name:
+        path, key = name.rsplit(":", 1)
+        pack = open_pack(path)
+        return pack[int(key)] if key.isdigit() else pack.get(key)
+    path = name if name.endswith(".json") else os.path.join(LEVELS_DIR, name + ".json")
+    with open(path) as file:
+        return Level.from_dict(json.load(file), os.path.splitext(os.path.basename(path))[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack Lightbot level files into one .lbp file")
+    parser.add_argument("levels", nargs="+", help="level JSON files")
+    parser.add_argument("-o", "--output", required=True, help="pack file to write")
+    args = parser.parse_args(argv)
+    write_pack(args.output, [load_level(path) for path in args.levels])
+
+
+if __name__ == "__main__":
+    main()
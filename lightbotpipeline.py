@@ -0,0 +1,83 @@
+# Streaming mass grading over JSONL. lightbotgrader grades the input in
+# fixed chunks of lines; here submissions are grouped by level across the
+# whole stream instead. Each level fills its own batch, and a full batch is
+# graded by lightbotgrader.grade_lines on the grader's pool, so a level is
+# loaded once per batch (named levels once per worker, by load_level's
+# cache). Every stage is a generator, so memory holds only the open batches
+# and the batches in flight, however large the input file is.
+#
+# Results are written batch by batch rather than in input order; each one
+# carries its submission's "id", or the input line number when there is none.
+#
+#   python lightbotpipeline.py submissions.jsonl -o results.jsonl
+
+import argparse
+import json
+
+from lightbotgrader import grade_lines, numbered_lines, run_cli, run_in_pool
+
+BATCH_SIZE = 2048  # submissions graded together for one level
+MAX_WAITING = 65536  # submissions held in partly filled batches
+
+
+def level_key(line):
+    # Named levels by name, inline boards by their canonical JSON. Lines that
+    # can't be read share the None batch, where grade_lines reports them.
+    try:
+        level = json.loads(line)["level"]
+    except (KeyError, TypeError, ValueError):
+        return None
+    return level if isinstance(level, str) else json.dumps(level, sort_keys=True)
+
+
+def batch_by_level(lines, batch_size=BATCH_SIZE, max_waiting=MAX_WAITING):
+    # Yields batches of (line number, line) pairs that share a level. A batch
+    # is released when it is full; if too many submissions are waiting across
+    # levels, the biggest partial batch goes early so the wait stays bounded.
+    batches = {}
+    # Keys of the open batches by batch size, to find the biggest without
+    # scanning every level
+    by_size = [set() for _ in range(batch_size)]
+    largest = 0
+    waiting = 0
+    for number, line in lines:
+        key = level_key(line)
+        batch = batches.setdefault(key, [])
+        by_size[len(batch)].discard(key)
+        batch.append((number, line))
+        waiting += 1
+        if len(batch) >= batch_size:
+            del batches[key]
+            waiting -= len(batch)
+            yield batch
+            continue
+        by_size[len(batch)].add(key)
+        largest = max(largest, len(batch))
+        if waiting > max_waiting:
+            while not by_size[largest]:
+                largest -= 1
+            batch = batches.pop(by_size[largest].pop())
+            waiting -= len(batch)
+            yield batch
+    yield from batches.values()
+
+
+def grade_by_level(file, workers=None, batch_size=BATCH_SIZE, max_waiting=MAX_WAITING):
+    # Result lines for an open JSONL file, batch by batch
+    batches = batch_by_level(numbered_lines(file), batch_size, max_waiting)
+    return run_in_pool(grade_lines, batches, workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade Lightbot programs from a JSONL file, level by level")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="submissions per level batch")
+    parser.add_argument("--max-waiting", type=int, default=MAX_WAITING, help="submissions held in partial batches")
+    run_cli(
+        parser,
+        lambda file, args: grade_by_level(file, args.workers, args.batch_size, args.max_waiting),
+        argv,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# Headless Lightbot rules. ChessboardGame in lightbotkernel.py only draws this
+# state, so programs can be evaluated without Panda3D, a window or a GPU.
+
+from lightbotbitboard import Bitboard
+from lightbottransitions import TransitionTable
+
+INSTRUCTIONS = ("forward", "left", "right", "jump", "color")
+FORWARD, LEFT, RIGHT, JUMP, COLOR = range(len(INSTRUCTIONS))
+OPCODES = {name: opcode for opcode, name in enumerate(INSTRUCTIONS)}
+
+# Headings are stored as an index into HEADINGS (degrees, as in player_direction)
+HEADINGS = (0, 90, 180, 270)
+# Same convention as move_player: 0 faces -y, 90 faces +x, 180 faces +y, 270 faces -x
+
+
+class Board:
+    def __init__(self, width=8, height=8, goals=(), start=(0, 0, 0), heights=None):
+        self.width = width
+        self.height = height
+        # heights[x][y] like terrain_heights in deneme2.py; 0 leaves a hole
+        if heights is None:
+            heights = [[1] * height for x in range(width)]
+        self.heights = [list(column) for column in heights]
+        # Boards also come from untrusted submissions, so anything that would
+        # index outside the board later is rejected here
+        if len(self.heights) != width or any(len(column) != height for column in self.heights):
+            raise ValueError("heights must be %d columns of %d tiles" % (width, height))
+        if any(h < 0 for column in self.heights for h in column):
+            raise ValueError("negative tile height")
+        goals = [tuple(goal) for goal in goals]
+        for x, y in goals:
+            if not (0 <= x < width and 0 <= y < height):
+                raise ValueError("goal %r is off the board" % ((x, y),))
+        self.goals = frozenset(self.index(x, y) for x, y in goals)
+        self.start = tuple(start)  # x, y, heading in degrees
+        x, y, direction = self.start
+        if not (0 <= x < width and 0 <= y < height) or not self.heights[x][y]:
+            raise ValueError("start %r is not on a tile" % ((x, y),))
+        if direction % 360 not in HEADINGS:
+            raise ValueError("start heading %r is not one of %r" % (direction, HEADINGS))
+        self.bits = Bitboard(width, height, [h for column in self.heights for h in column], self.goals)
+        self.transitions = TransitionTable(self.bits)
+
+    def index(self, x, y):
+        # Tiles are numbered column by column to match chessboard[x][y]
+        return x * self.height + y
+
+    def to_dict(self):
+        data = {
+            "width": self.width,
+            "height": self.height,
+            "goals": sorted(divmod(i, self.height) for i in self.goals),
+            "start": list(self.start),
+        }
+        if any(h != 1 for column in self.heights for h in column):
+            data["heights"] = self.heights
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data.get("width", 8),
+            data.get("height", 8),
+            [tuple(goal) for goal in data.get("goals", ())],
+            data.get("start", (0, 0, 0)),
+            data.get("heights"),
+        )
+
+
+class Simulation:
+    __slots__ = ("board", "bits", "table", "pose", "lit", "steps", "trace")
+
+    def __init__(self, board):
+        self.board = board
+        self.bits = board.bits
+        self.table = board.transitions.next
+        # lightbottrace.TraceRecorder that gets every action, or None
+        self.trace = None
+        self.reset()
+
+    def reset(self):
+        x, y, direction = self.board.start
+        self.pose = self.board.index(x, y) << 2 | HEADINGS.index(direction % 360)
+        self.lit = 0  # bitboard of lit tiles
+        self.steps = 0
+
+    @property
+    def tile(self):
+        return self.pose >> 2
+
+    @tile.setter
+    def tile(self, tile):
+        self.pose = tile << 2 | self.pose & 3
+
+    @property
+    def heading(self):
+        # Index into HEADINGS
+        return self.pose & 3
+
+    @heading.setter
+    def heading(self, heading):
+        self.pose = self.pose & ~3 | heading
+
+    @property
+    def x(self):
+        return (self.pose >> 2) // self.board.height
+
+    @property
+    def y(self):
+        return (self.pose >> 2) % self.board.height
+
+    @property
+    def direction(self):
+        return HEADINGS[self.pose & 3]
+
+    @property
+    def placement(self):
+        # x, y and heading in degrees
+        x, y = divmod(self.pose >> 2, self.board.height)
+        return x, y, HEADINGS[self.pose & 3]
+
+    @property
+    def state(self):
+        # Whole simulation state as one int, cheap to hash and compare
+        return self.lit * (self.bits.tiles << 2) + self.pose
+
+    @property
+    def solved(self):
+        return self.lit & self.bits.goals == self.bits.goals
+
+    @property
+    def unlit_goals(self):
+        return self.bits.unlit_goals(self.lit)
+
+    def lit_tiles(self):
+        height = self.board.height
+        return [divmod(i, height) for i in self.bits.tiles_in(self.lit)]
+
+    def is_lit(self, x, y):
+        return bool(self.lit >> self.board.index(x, y) & 1)
+
+    # Movement is one lookup in the level's transition table (see
+    # lightbottransitions), so these rules match the solver and grader exactly
+    def forward(self):
+        self.pose = self.table[self.pose << 2 | FORWARD]
+
+    def turn_left(self):
+        self.pose = self.table[self.pose << 2 | LEFT]
+
+    def turn_right(self):
+        self.pose = self.table[self.pose << 2 | RIGHT]
+
+    def jump(self):
+        self.pose = self.table[self.pose << 2 | JUMP]
+
+    def toggle_light(self):
+        self.lit ^= 1 << (self.pose >> 2)
+
+    def step(self, instruction):
+        if instruction.__class__ is str:
+            instruction = OPCODES[instruction]
+        ACTIONS[instruction](self)
+        self.steps += 1
+        if self.trace is not None:
+            self.trace.record(self.steps, instruction, self.pose)
+
+    def run(self, program):
+        if self.trace is not None:
+            # One step at a time so each action is recorded
+            for instruction in program:
+                self.step(instruction)
+            return self.solved
+        actions = ACTIONS
+        for instruction in program:
+            if instruction.__class__ is str:
+                instruction = OPCODES[instruction]
+            actions[instruction](self)
+        self.steps += len(program)
+        return self.solved
+
+    def execute(self, code):
+        # Straight-line bytecode (see lightbotbytecode) with the table
+        # lookups inlined
+        if self.trace is not None:
+            return self.run(code)
+        table = self.table
+        pose = self.pose
+        lit = self.lit
+        for opcode in code:
+            if opcode == COLOR:
+                lit ^= 1 << (pose >> 2)
+            else:
+                pose = table[pose << 2 | opcode]
+        self.pose = pose
+        self.lit = lit
+        self.steps += len(code)
+        return self.solved
+
+
+# Indexed by opcode
+ACTIONS = (
+    Simulation.forward,
+    Simulation.turn_left,
+    Simulation.turn_right,
+    Simulation.jump,
+    Simulation.toggle_light,
+)
+
+
+def run_program(board, program):
+    sim = Simulation(board)
+    sim.run(program)
+    return sim
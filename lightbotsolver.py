@@ -0,0 +1,219 @@
+# Shortest-program search for Lightbot boards. A search state is one integer:
+#
+#   state = (goal_mask << (tile_bits + 2)) | (tile << 2) | heading
+#
+# where goal_mask has one bit per goal tile that is currently lit. Moves come
+# from the level's transition table, the same one Simulation steps through,
+# so the solver always follows the game rules.
+
+import heapq
+from collections import deque
+
+from lightbotsim import INSTRUCTIONS, COLOR, HEADINGS, Board
+
+
+def board_from_game(game, goals=None):
+    # Snapshot a running ChessboardGame as a Board starting from the current pose
+    board = game.sim.board
+    if goals is None:
+        goals = [divmod(tile, board.height) for tile in board.goals]
+    x, y = game.player_pos
+    return Board(board.width, board.height, goals, (x, y, game.player_direction), board.heights)
+
+
+class Solver:
+    def __init__(self, board):
+        self.board = board
+        self.tiles = board.width * board.height
+        self.tile_bits = max(1, (self.tiles - 1).bit_length())
+        self.goals = sorted(board.goals)
+        self.goal_bit = {tile: 1 << i for i, tile in enumerate(self.goals)}
+        self.moves = self.build_moves()
+        self.distances = [self.distances_to(goal) for goal in self.goals]
+        # Tile-to-tile distance between goals, whatever the heading on arrival
+        directed = [
+            [min(distance[goal << 2 | heading] for heading in range(4)) for goal in self.goals]
+            for distance in self.distances
+        ]
+        # Jumping down is one-way on boards with heights, so a route may cross
+        # between two goals in either direction; the shorter one keeps the
+        # spanning tree a lower bound
+        self.goal_distances = [
+            [min(directed[i][j], directed[j][i]) for j in range(len(self.goals))]
+            for i in range(len(self.goals))
+        ]
+        self.tree_lengths = {}
+
+    def build_moves(self):
+        # moves[tile * 4 + heading] -> ((action, tile * 4 + heading), ...) for
+        # every pose-changing action
+        transitions = self.board.transitions
+        return [transitions.moves(pose) for pose in range(self.tiles * 4)]
+
+    def distances_to(self, goal):
+        # Fewest moves from every pose to stand on goal, by BFS over reversed edges
+        incoming = [[] for _ in range(self.tiles * 4)]
+        for pose, targets in enumerate(self.moves):
+            for action, target in targets:
+                incoming[target].append(pose)
+        unreachable = self.tiles * 4
+        distance = [unreachable] * (self.tiles * 4)
+        queue = deque()
+        for heading in range(4):
+            distance[goal << 2 | heading] = 0
+            queue.append(goal << 2 | heading)
+        while queue:
+            pose = queue.popleft()
+            for source in incoming[pose]:
+                if distance[source] == unreachable:
+                    distance[source] = distance[pose] + 1
+                    queue.append(source)
+        return distance
+
+    def tree_length(self, mask):
+        # Minimum spanning tree over the unlit goals (Prim's algorithm), cached
+        # per goal mask. Any route through all of them is at least this long.
+        length = self.tree_lengths.get(mask)
+        if length is None:
+            unlit = [i for i in range(len(self.goals)) if not mask >> i & 1]
+            length = 0
+            if unlit:
+                reach = {i: self.goal_distances[unlit[0]][i] for i in unlit[1:]}
+                while reach:
+                    nearest = min(reach, key=reach.get)
+                    length += reach.pop(nearest)
+                    row = self.goal_distances[nearest]
+                    for i in reach:
+                        if row[i] < reach[i]:
+                            reach[i] = row[i]
+            self.tree_lengths[mask] = length
+        return length
+
+    def heuristic(self, pose, mask):
+        # Every unlit goal still needs one color action. The robot must walk
+        # to the farthest unlit goal, and also to the nearest one and then
+        # along a route through the rest, so neither bound overestimates.
+        farthest = 0
+        nearest = self.tiles * 4
+        unlit = 0
+        for i, distance in enumerate(self.distances):
+            if not mask >> i & 1:
+                unlit += 1
+                steps = distance[pose]
+                if steps > farthest:
+                    farthest = steps
+                if steps < nearest:
+                    nearest = steps
+        if not unlit:
+            return 0
+        return unlit + max(farthest, nearest + self.tree_length(mask))
+
+    def solve(self, start=None, lit=()):
+        # Returns the shortest list of instructions that lights every goal, or
+        # None when no program can
+        x, y, direction = start or self.board.start
+        pose_bits = self.tile_bits + 2
+        pose_mask = (1 << pose_bits) - 1
+        full = (1 << len(self.goals)) - 1
+
+        mask = 0
+        for tile_x, tile_y in lit:
+            mask |= self.goal_bit.get(self.board.index(tile_x, tile_y), 0)
+        pose = self.board.index(x, y) << 2 | HEADINGS.index(direction % 360)
+        state = mask << pose_bits | pose
+
+        # Give up early when some unlit goal can never be reached
+        for i, distance in enumerate(self.distances):
+            if not mask >> i & 1 and distance[pose] >= self.tiles * 4:
+                return None
+
+        best = {state: 0}
+        parent = {state: None}
+        # Ties on the estimate go to the deepest state first
+        frontier = [(self.heuristic(pose, mask), 0, state)]
+        while frontier:
+            estimate, cost, state = heapq.heappop(frontier)
+            cost = -cost
+            if cost > best[state]:
+                continue
+            mask = state >> pose_bits
+            if mask == full:
+                return self.path(parent, state)
+
+            pose = state & pose_mask
+            successors = [(action, mask << pose_bits | target) for action, target in self.moves[pose]]
+            # Lighting is only worth doing on an unlit goal
+            bit = self.goal_bit.get(pose >> 2, 0)
+            if bit and not mask & bit:
+                successors.append((COLOR, (mask | bit) << pose_bits | pose))
+
+            cost += 1
+            for action, successor in successors:
+                if cost < best.get(successor, cost + 1):
+                    best[successor] = cost
+                    parent[successor] = (state, action)
+                    remaining = self.heuristic(successor & pose_mask, successor >> pose_bits)
+                    heapq.heappush(frontier, (cost + remaining, -cost, successor))
+        return None
+
+    def path(self, parent, state):
+        program = []
+        while parent[state] is not None:
+            state, action = parent[state]
+            program.append(INSTRUCTIONS[action])
+        program.reverse()
+        return program
+
+
+def solve(board, start=None, lit=()):
+    return Solver(board).solve(start, lit)
+
+
+def shortest_length(board):
+    # Length of the shortest program by plain breadth-first search, with no
+    # heuristic to get wrong; None when the level can't be solved
+    goals = sorted(board.goals)
+    goal_bit = {tile: 1 << i for i, tile in enumerate(goals)}
+    full = (1 << len(goals)) - 1
+    x, y, direction = board.start
+    start = (board.index(x, y) << 2 | HEADINGS.index(direction % 360), 0)
+    distance = {start: 0}
+    queue = deque([start])
+    while queue:
+        state = queue.popleft()
+        pose, mask = state
+        if mask == full:
+            return distance[state]
+        successors = [(target, mask) for action, target in board.transitions.moves(pose)]
+        successors.append((pose, mask | goal_bit.get(pose >> 2, 0)))
+        for successor in successors:
+            if successor not in distance:
+                distance[successor] = distance[state] + 1
+                queue.append(successor)
+    return None
+
+
+def check(trials=500, seed=0):
+    # Compares solve() with shortest_length() on random boards with heights,
+    # where jumping down is one-way
+    import random
+
+    rng = random.Random(seed)
+    failures = 0
+    for _ in range(trials):
+        width, height = rng.randrange(2, 6), rng.randrange(2, 6)
+        heights = [[rng.randrange(5) for y in range(height)] for x in range(width)]
+        x, y = rng.randrange(width), rng.randrange(height)
+        heights[x][y] = max(heights[x][y], 1)
+        goals = {(rng.randrange(width), rng.randrange(height)) for _ in range(rng.randrange(1, 5))}
+        board = Board(width, height, goals, (x, y, rng.choice(HEADINGS)), heights)
+        program = solve(board)
+        if (None if program is None else len(program)) != shortest_length(board):
+            failures += 1
+            print("not shortest:", board.to_dict(), program)
+    print("%d of %d boards solved optimally" % (trials - failures, trials))
+    return failures
+
+
+if __name__ == "__main__":
+    check()
@@ -0,0 +1,309 @@
+# Enumerative synthesis of Lightbot reference solutions. Every program found
+# lights all goals, halts, and fits the level's instruction slots: main gets
+# the level's "main" limit (MAIN_SLOTS, the add_movement queue length, when
+# there is none) and p1/p2 are only used when the level gives them a limit.
+# Loops are not generated.
+#
+# The search space is cut down three ways:
+#   - symmetric sequences are never built: left after right and the other way
+#     round, right right (left left turns the same), three equal turns and
+#     color color (see redundant)
+#   - procedure bodies are compared by their effect from every pose (exit
+#     pose and goals toggled); only the first, shortest body with a given
+#     effect is kept or extended
+#   - main is a breadth-first search over (pose, lit goals, procedures used)
+#     states, each state expanded once, and solutions are not extended
+#
+# Only goal tiles count: whether other tiles end up lit never decides if a
+# program solves the level, so they are left out of effects and states, as in
+# the solver.
+#
+# Procedure sets are tried smallest first: main alone, then p1, then p1 with
+# p2 (p1 may call p2). Each set is a task for a worker process.
+#
+#   python lightbotsynth.py terrain --limit 100 -o solutions.jsonl
+
+import argparse
+import hashlib
+import json
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from lightbotgrader import run_in_pool
+from lightbotlevels import Level, load_level
+from lightbotsim import COLOR, HEADINGS, INSTRUCTIONS, LEFT, RIGHT
+
+MAIN_SLOTS = 8  # instruction queue length in add_movement
+CHUNK_SIZE = 64  # p1 bodies per worker task
+ACTIONS = tuple(range(len(INSTRUCTIONS)))
+
+
+def redundant(body, token):
+    # True when appending token to body builds a sequence that a shorter or
+    # canonical one already covers
+    if not body:
+        return False
+    last = body[-1]
+    if token == LEFT:
+        return last == RIGHT or len(body) > 1 and last == LEFT and body[-2] == LEFT
+    if token == RIGHT:
+        return last == LEFT or last == RIGHT
+    return token == COLOR and last == COLOR
+
+
+class Macro:
+    # The effect of calling a procedure from each pose: exits[pose] is where
+    # the robot ends up and flips[pose] the goals it toggles on the way, as
+    # NumPy arrays for composing bodies and as lists for the main search.
+    # used is the bitmask of procedures the call runs.
+    def __init__(self, exits, flips, used):
+        self.exits = exits
+        self.flips = flips
+        self.used = used
+        self.exit_list = exits.tolist()
+        self.flip_list = [int.from_bytes(row.tobytes(), "little") for row in flips]
+
+
+class Synthesizer:
+    def __init__(self, level, limits=None):
+        self.level = level
+        self.board = level.board
+        limits = dict(limits or {})
+        self.main_slots = limits.get("main", level.limits.get("main", MAIN_SLOTS))
+        self.p1_slots = limits.get("p1", level.limits.get("p1", 0))
+        self.p2_slots = limits.get("p2", level.limits.get("p2", 0)) if self.p1_slots else 0
+
+        bits = self.board.bits
+        self.poses = bits.tiles * 4
+        self.table = self.board.transitions.as_array()
+        x, y, direction = self.board.start
+        self.start = self.board.index(x, y) << 2 | HEADINGS.index(direction % 360)
+        # Goal number of every tile, -1 off goal; lit goals are a bitmask of these
+        goals = sorted(self.board.goals)
+        self.goal_of = np.full(bits.tiles, -1, dtype=np.int32)
+        self.goal_of[goals] = np.arange(len(goals))
+        self.full = (1 << len(goals)) - 1
+        # Toggled goals per pose, one bit per goal packed into bytes
+        self.flip_bytes = (len(goals) + 7) // 8
+        self.rows = np.arange(self.poses)
+
+    def effect_after(self, exits, flips, token, macros):
+        if token == COLOR:
+            goal = self.goal_of[exits >> 2]
+            on_goal = goal >= 0
+            goal = goal[on_goal]
+            flips = flips.copy()
+            flips[self.rows[on_goal], goal >> 3] ^= (1 << (goal & 7)).astype(np.uint8)
+            return exits, flips
+        if token.__class__ is int:
+            return self.table[exits << 2 | token], flips
+        macro = macros[token]
+        return macro.exits[exits], flips ^ macro.flips[exits]
+
+    def bodies(self, slots, macros=None):
+        # Procedure bodies of 2 to slots tokens with distinct effects, shortest
+        # first, as (body, exits, flips). Tokens are opcodes and the names in
+        # macros. Identical effects are found by digest, so a prefix that
+        # behaves like an earlier one is dropped along with its extensions.
+        macros = macros or {}
+        alphabet = ACTIONS + tuple(sorted(macros))
+        exits = np.arange(self.poses, dtype=np.int32)
+        flips = np.zeros((self.poses, self.flip_bytes), dtype=np.uint8)
+        seen = {self.digest(exits, flips)}
+        frontier = [((), exits, flips)]
+        for length in range(1, slots + 1):
+            extended = []
+            for body, exits, flips in frontier:
+                for token in alphabet:
+                    if redundant(body, token):
+                        continue
+                    after = self.effect_after(exits, flips, token, macros)
+                    digest = self.digest(*after)
+                    if digest in seen:
+                        continue
+                    seen.add(digest)
+                    child = body + (token,)
+                    if length > 1:
+                        yield child, after[0], after[1]
+                    if length < slots:
+                        extended.append((child, after[0], after[1]))
+            frontier = extended
+
+    @staticmethod
+    def digest(exits, flips):
+        return hashlib.blake2b(exits.tobytes() + flips.tobytes(), digest_size=16).digest()
+
+    def search(self, macros):
+        # Main bodies that solve the level with the given {name: Macro}
+        # procedures, calling every one of them. Breadth first, so each is the
+        # shortest way to its solved state.
+        goal_of = self.goal_of.tolist()
+        full = self.full
+        table = self.table.tolist()
+        names = sorted(macros)
+        required = 0
+        for name in names:
+            required |= macros[name].used
+        alphabet = ACTIONS + tuple(names)
+        # Goals some procedure can toggle from some pose
+        toggled = 0
+        for name in names:
+            for flips in macros[name].flip_list:
+                toggled |= flips
+
+        start = (self.start, 0, 0)
+        seen = {start}
+        frontier = deque([(start, ())])
+        solutions = []
+        while frontier:
+            (pose, lit, used), body = frontier.popleft()
+            if len(body) == self.main_slots:
+                continue
+            for token in alphabet:
+                if redundant(body, token):
+                    continue
+                if token == COLOR:
+                    goal = goal_of[pose >> 2]
+                    if goal < 0:
+                        continue
+                    # Turning a goal off only helps when a procedure can turn
+                    # it back on later
+                    if lit >> goal & 1 and not toggled >> goal & 1:
+                        continue
+                    state = (pose, lit ^ 1 << goal, used)
+                elif token.__class__ is int:
+                    state = (table[pose << 2 | token], lit, used)
+                else:
+                    macro = macros[token]
+                    state = (macro.exit_list[pose], lit ^ macro.flip_list[pose], used | macro.used)
+                if state in seen:
+                    continue
+                seen.add(state)
+                if state[1] == full and state[2] == required:
+                    solutions.append(body + (token,))
+                    continue
+                frontier.append((state, body + (token,)))
+        return solutions
+
+    def run(self, task):
+        # Solves one task from tasks() and returns the programs found
+        kind = task[0]
+        found = []
+        if kind == "main":
+            for main in self.search({}):
+                found.append({"main": main})
+        elif kind == "p1":
+            for p1 in task[1]:
+                exits, flips = self.effect_of(p1, {})
+                for main in self.search({"p1": Macro(exits, flips, 1)}):
+                    found.append({"main": main, "p1": p1})
+        else:
+            p2, length = task[1], task[2]
+            exits, flips = self.effect_of(p2, {})
+            macros = {"p2": Macro(exits, flips, 2)}
+            for p1, exits, flips in self.bodies(length, macros):
+                if len(p1) < length:
+                    continue
+                # Two independent procedures are the same program with the
+                # names swapped, so only one order is kept
+                calls = "p2" in p1
+                if not calls and p1 >= p2:
+                    continue
+                macro = Macro(exits, flips, 3 if calls else 1)
+                for main in self.search({"p1": macro, "p2": macros["p2"]}):
+                    found.append({"main": main, "p1": p1, "p2": p2})
+        return [self.program(solution) for solution in found]
+
+    def effect_of(self, body, macros):
+        exits = np.arange(self.poses, dtype=np.int32)
+        flips = np.zeros((self.poses, self.flip_bytes), dtype=np.uint8)
+        for token in body:
+            exits, flips = self.effect_after(exits, flips, token, macros)
+        return exits, flips
+
+    @staticmethod
+    def program(solution):
+        # Token tuples -> instruction names as compile_program takes them
+        return {
+            name: [INSTRUCTIONS[token] if token.__class__ is int else token for token in body]
+            for name, body in solution.items()
+        }
+
+    def tasks(self, chunk_size=CHUNK_SIZE):
+        # Work for the pool, smallest procedure sets first
+        yield ("main",)
+        if not self.p1_slots:
+            return
+        by_length = [[] for _ in range(max(self.p1_slots, self.p2_slots) + 1)]
+        for body, exits, flips in self.bodies(len(by_length) - 1):
+            by_length[len(body)].append(body)
+        for total in range(2, self.p1_slots + self.p2_slots + 1):
+            if total <= self.p1_slots:
+                bodies = by_length[total]
+                for i in range(0, len(bodies), chunk_size):
+                    yield ("p1", bodies[i:i + chunk_size])
+            # p1 needs at least two tokens, one of which may be the call to p2
+            for length in range(max(2, total - self.p1_slots), min(self.p2_slots, total - 2) + 1):
+                for p2 in by_length[length]:
+                    yield ("pair", p2, total - length)
+
+
+_worker = None
+
+
+def _start_worker(data, limits):
+    global _worker
+    _worker = Synthesizer(Level.from_dict(data), limits)
+
+
+def _run_task(task):
+    return _worker.run(task)
+
+
+def synthesize(level, limits=None, workers=None, chunk_size=CHUNK_SIZE):
+    # Yields solution programs as the pool finds them, in task order. Stop
+    # iterating (or close the generator) to cancel the rest of the search.
+    planner = Synthesizer(level, limits)
+    return run_in_pool(_run_task, planner.tasks(chunk_size), workers, _start_worker, (level.to_dict(), limits))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Lightbot programs that solve a level")
+    parser.add_argument("level", help="level name or file, as load_level takes it")
+    parser.add_argument("-o", "--output", help="where to write solutions as JSONL (default: stdout)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many solutions")
+    parser.add_argument("--timeout", type=float, default=None, help="stop after this many seconds")
+    for name in ("main", "p1", "p2"):
+        parser.add_argument("--" + name, type=int, default=None, help="slots for %s (default: the level's)" % name)
+    args = parser.parse_args(argv)
+
+    level = load_level(args.level)
+    limits = {name: getattr(args, name) for name in ("main", "p1", "p2") if getattr(args, name) is not None}
+    output = open(args.output, "w") if args.output else sys.stdout
+    start = time.perf_counter()
+    found = 0
+    solutions = synthesize(level, limits, args.workers)
+    try:
+        for program in solutions:
+            output.write(json.dumps(program) + "\n")
+            found += 1
+            if args.limit is not None and found >= args.limit:
+                break
+            if args.timeout is not None and time.perf_counter() - start > args.timeout:
+                break
+    finally:
+        solutions.close()
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    rate = found / elapsed if elapsed > 0 else 0.0
+    print(f"found {found} solutions in {elapsed:.2f}s ({rate:,.0f} solutions/sec)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# Binary execution traces, so a run can be replayed exactly as it happened.
+# Set a TraceRecorder as a Simulation's trace and every action it runs is
+# written as it happens, whichever front end drives it: Simulation.step, run
+# and execute, interpret(), and the ChessboardGame windows, which take a
+# trace path. Without a recorder the interpreter only pays one None check
+# per action and run/execute one check per call.
+#
+#   b"LBT" + version byte
+#   header: tiles, board height, start pose (uint32 each), start lit tiles
+#           (ceil(tiles / 8) bytes, little-endian)
+#   records: step (uint32), opcode (uint8), pose after the action (uint32),
+#            tile toggled (uint16, NO_TILE when the lit tiles did not change)
+#   keyframes: record index (uint32) + lit tiles, every KEYFRAME_INTERVAL records
+#   trailer: record count (uint64), keyframe count (uint32)
+#
+# step is the interpreter's instruction count (control instructions count
+# but are not recorded) or Simulation.steps for the game. TraceReader.state_at
+# finds the pose from one record and the lit tiles from the nearest
+# keyframe, so seeking costs the same anywhere in the trace.
+#
+#   python lightbottrace.py record terrain program.json -o run.lbt
+#   python lightbottrace.py show run.lbt --step 120
+
+import argparse
+import json
+import struct
+
+import numpy as np
+
+from lightbotsim import COLOR, HEADINGS, INSTRUCTIONS, Simulation
+
+TRACE_MAGIC = b"LBT"
+TRACE_VERSION = 1
+KEYFRAME_INTERVAL = 1024
+NO_TILE = 0xFFFF
+FLUSH_SIZE = 4096  # records buffered before a write
+
+_HEADER = struct.Struct("<3sBIII")
+_RECORD = struct.Struct("<IBIH")
+_RECORD_DTYPE = np.dtype([("step", "<u4"), ("opcode", "u1"), ("pose", "<u4"), ("tile", "<u2")])
+_KEYFRAME = struct.Struct("<I")
+_TRAILER = struct.Struct("<QI")
+
+
+class TraceRecorder:
+    # Writes the actions applied to sim from now on. Call close() to finish
+    # the file; a trace without its trailer can not be read.
+    def __init__(self, path, sim):
+        tiles = sim.bits.tiles
+        if tiles > NO_TILE:
+            raise ValueError("boards over %d tiles can not be traced" % NO_TILE)
+        self.lit_bytes = (tiles + 7) // 8
+        self.file = open(path, "wb")
+        self.file.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, tiles, sim.board.height, sim.pose))
+        self.file.write(sim.lit.to_bytes(self.lit_bytes, "little"))
+        self.buffer = bytearray()
+        self.count = 0
+        self.lit = sim.lit
+        self.keyframes = [(0, sim.lit)]
+
+    def record(self, step, opcode, pose):
+        # Called after the action has been applied
+        tile = NO_TILE
+        if opcode == COLOR:
+            tile = pose >> 2
+            self.lit ^= 1 << tile
+        self.buffer += _RECORD.pack(step, opcode, pose, tile)
+        self.count += 1
+        if not self.count % KEYFRAME_INTERVAL:
+            self.keyframes.append((self.count, self.lit))
+        if len(self.buffer) >= FLUSH_SIZE * _RECORD.size:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.write(self.buffer)
+        for index, lit in self.keyframes:
+            self.file.write(_KEYFRAME.pack(index) + lit.to_bytes(self.lit_bytes, "little"))
+        self.file.write(_TRAILER.pack(self.count, len(self.keyframes)))
+        self.file.close()
+        self.file = None
+
+
+class TraceReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            # Read whole rather than memory-mapped: record views handed out by
+            # state_at or taken from records stay valid after close()
+            self.data = file.read()
+        magic, version, self.tiles, self.height, self.start_pose = _HEADER.unpack_from(self.data, 0)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise ValueError("%s is not a trace" % path)
+        self.lit_bytes = (self.tiles + 7) // 8
+        offset = _HEADER.size
+        self.start_lit = int.from_bytes(self.data[offset:offset + self.lit_bytes], "little")
+        offset += self.lit_bytes
+
+        count, keyframe_count = _TRAILER.unpack_from(self.data, len(self.data) - _TRAILER.size)
+        self.records = np.frombuffer(self.data, dtype=_RECORD_DTYPE, count=count, offset=offset)
+        offset += count * _RECORD.size
+        # Record index -> lit tiles after that many records; index k * KEYFRAME_INTERVAL
+        self.keyframes = []
+        size = _KEYFRAME.size + self.lit_bytes
+        for start in range(offset, offset + keyframe_count * size, size):
+            self.keyframes.append(int.from_bytes(self.data[start + _KEYFRAME.size:start + size], "little"))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        # (step, opcode, pose, tile) per record
+        for step, opcode, pose, tile in self.records.tolist():
+            yield step, opcode, pose, tile
+
+    @property
+    def last_step(self):
+        return int(self.records["step"][-1]) if len(self.records) else 0
+
+    def index_of(self, step):
+        # Number of records at or before step
+        return int(np.searchsorted(self.records["step"], step, side="right"))
+
+    def state_at(self, step):
+        # (pose, lit tiles) once every action up to and including step has run
+        index = self.index_of(step)
+        pose = int(self.records["pose"][index - 1]) if index else self.start_pose
+        keyframe = index // KEYFRAME_INTERVAL
+        lit = self.keyframes[keyframe]
+        # Tiles toggled an odd number of times since the keyframe
+        tiles = self.records["tile"][keyframe * KEYFRAME_INTERVAL:index]
+        tiles = tiles[tiles != NO_TILE]
+        if len(tiles):
+            for tile in np.flatnonzero(np.bincount(tiles, minlength=self.tiles) & 1).tolist():
+                lit ^= 1 << tile
+        return pose, lit
+
+    def placement(self, pose):
+        # x, y and heading in degrees, as Simulation.placement
+        x, y = divmod(pose >> 2, self.height)
+        return x, y, HEADINGS[pose & 3]
+
+    def seek(self, sim, step):
+        # Puts sim in the traced state at step. sim.steps counts actions only,
+        # while interpret() records its instruction count as the step.
+        sim.pose, sim.lit = self.state_at(step)
+        sim.steps = self.index_of(step)
+        return sim
+
+    def close(self):
+        self.records = None
+        self.data = None
+
+
+def record_run(board, code, path, **limits):
+    # Runs code headless through interpret() and writes its trace; returns
+    # the status and the finished Simulation
+    from lightbotbytecode import interpret
+
+    sim = Simulation(board)
+    sim.trace = TraceRecorder(path, sim)
+    try:
+        status = interpret(sim, code, **limits)
+    finally:
+        sim.trace.close()
+        sim.trace = None
+    return status, sim
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record and inspect Lightbot execution traces")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="run a program headless and trace it")
+    record.add_argument("level", help="level name or file, as load_level takes it")
+    record.add_argument("program", help="JSON file with the program")
+    record.add_argument("-o", "--output", required=True, help="trace file to write")
+    record.add_argument("--max-steps", type=int, default=100000)
+    show = commands.add_parser("show", help="print the state of a trace at a step")
+    show.add_argument("trace", help="trace file")
+    show.add_argument("--step", type=int, default=None, help="step to show (default: the last)")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        from lightbotbytecode import compile_program
+        from lightbotlevels import load_level
+
+        with open(args.program) as file:
+            code = compile_program(json.load(file))
+        status, sim = record_run(load_level(args.level).board, code, args.output, max_steps=args.max_steps)
+        print("%s after %d actions" % (status, sim.steps))
+    else:
+        reader = TraceReader(args.trace)
+        step = reader.last_step if args.step is None else args.step
+        pose, lit = reader.state_at(step)
+        index = reader.index_of(step)
+        last = INSTRUCTIONS[int(reader.records["opcode"][index - 1])] if index else None
+        print(json.dumps({
+            "step": step,
+            "records": len(reader),
+            "last": last,
+            "pose": list(reader.placement(pose)),
+            "lit": [list(divmod(tile, reader.height)) for tile in range(reader.tiles) if lit >> tile & 1],
+        }))
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# Per-level transition table. A pose is one int, tile << 2 | heading, and
+# next[pose << 2 | action] is the pose after a movement action (forward,
+# left, right or jump, numbered as in lightbotsim.INSTRUCTIONS). The
+# board's walking and jumping rules are applied once, when the level is
+# loaded; afterwards Simulation, the bytecode interpreter, the solver and the
+# batch grader all move the robot with the same single list lookup.
+
+MOVE_ACTIONS = 4  # forward, left, right, jump; color never moves the robot
+
+
+class TransitionTable:
+    def __init__(self, bits):
+        self.tiles = bits.tiles
+        self.next = [0] * (bits.tiles * 4 * MOVE_ACTIONS)
+        for tile in range(bits.tiles):
+            for heading in range(4):
+                pose = tile << 2 | heading
+                base = pose << 2
+                ahead = tile + bits.offsets[heading]
+                # Forward keeps the level; off the board or a different
+                # height leaves the robot where it is
+                self.next[base] = ahead << 2 | heading if bits.can_walk(tile, heading) else pose
+                self.next[base | 1] = tile << 2 | (heading - 1) & 3
+                self.next[base | 2] = tile << 2 | (heading + 1) & 3
+                # Jumping goes one level up or any number down
+                self.next[base | 3] = ahead << 2 | heading if bits.can_jump(tile, heading) else pose
+        self.array = None
+
+    def step(self, pose, action):
+        return self.next[pose << 2 | action]
+
+    def moves(self, pose):
+        # (action, next pose) for every action that changes the pose
+        base = pose << 2
+        return tuple(
+            (action, self.next[base | action])
+            for action in range(MOVE_ACTIONS)
+            if self.next[base | action] != pose
+        )
+
+    def as_array(self):
+        # The table as a NumPy array for vectorized lookups, built once
+        if self.array is None:
+            import numpy as np
+
+            self.array = np.array(self.next, dtype=np.int32)
+        return self.array
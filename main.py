@@ -5,11 +5,24 @@ from panda3d.core import loadPrcFile
 from panda3d.core import DirectionalLight, AmbientLight
 from panda3d.core import TransparencyAttrib
 from panda3d.core import WindowProperties
-from panda3d.core import CollisionTraverser, CollisionNode, CollisionBox, CollisionRay, CollisionHandlerQueue
+from panda3d.core import GeomNode, Vec3
 from direct.gui.OnscreenImage import OnscreenImage
 
+from blockatlas import applyBlockState, loadBlockTextures
+from chunkculler import ChunkCuller
+from chunkstreamer import ChunkStreamer
+from regionfile import RegionStore
+from terraingen import TerrainGenerator
+from voxelmesher import ChunkMesher, chooseLod
+from voxelraycast import raycast
+from voxelworld import BLOCK_IDS, BLOCK_SIZE, CHUNK_SHIFT, CHUNK_SIZE, VoxelWorld, cellAt, cellCenter
+
 loadPrcFile('settings.prc')
 
+TERRAIN_SEED = 0
+VIEW_RADIUS = 8  # loaded chunk columns around the camera
+SAVE_DIR = 'saves/world-%d' % TERRAIN_SEED  # edited chunks, see regionfile.py
+
 def degToRad(degrees):
     return degrees * (pi / 180.0)
 
@@ -19,15 +32,27 @@ class MyGame(ShowBase):
 
         self.selectedBlockType = 'grass'
 
+        self.world = VoxelWorld()
+        self.terrain = TerrainGenerator(TERRAIN_SEED)
+        self.mesher = ChunkMesher(self.world)
+        self.terrainRoot = render.attachNewNode('terrain')
+        self.chunkNodes = {}
+        self.chunkLods = {}  # chunk key -> level of detail it is meshed at
+        self.lodCameraPos = None
+        self.culler = ChunkCuller()
+
         self.loadModels()
         self.setupLights()
-        self.generateTerrain()
         self.setupCamera()
+        self.generateTerrain()
         self.setupSkybox()
         self.captureMouse()
         self.setupControls()
 
         taskMgr.add(self.update, 'update')
+        taskMgr.add(self.streamChunks, 'streamChunks')
+        taskMgr.add(self.swapChunkMeshes, 'swapChunkMeshes')
+        taskMgr.add(self.cullChunks, 'cullChunks')
 
     def update(self, task):
         dt = globalClock.getDt()
@@ -96,6 +121,7 @@ class MyGame(ShowBase):
         }
 
         self.accept('escape', self.releaseMouse)
+        self.accept('f5', self.saveWorld)
         self.accept('mouse1', self.handleLeftClick)
         self.accept('mouse3', self.placeBlock)
 
@@ -124,33 +150,35 @@ class MyGame(ShowBase):
         self.captureMouse()
         self.removeBlock()
 
-    def removeBlock(self):
-        if self.rayQueue.getNumEntries() > 0:
-            self.rayQueue.sortEntries()
-            rayHit = self.rayQueue.getEntry(0)
+    def lookedAtBlock(self):
+        # The block under the crosshairs, the face normal the line of sight
+        # enters through and the distance to the block's center, or None
+        origin = self.camera.getPos(render)
+        direction = render.getRelativeVector(self.camera, Vec3(0, 1, 0))
+        hit = raycast(self.world, origin, direction, self.reachDistance)
+        if hit is None:
+            return None
+        cell, normal, distance = hit
+        blockCenter = Vec3(*cellCenter(*cell))
+        return cell, normal, (blockCenter - origin).length()
 
-            hitNodePath = rayHit.getIntoNodePath()
-            hitObject = hitNodePath.getPythonTag('owner')
-            distanceFromPlayer = hitObject.getDistance(self.camera)
+    def removeBlock(self):
+        hit = self.lookedAtBlock()
+        if hit is not None:
+            cell, normal, distanceFromPlayer = hit
 
             if distanceFromPlayer < 12:
-                hitNodePath.clearPythonTag('owner')
-                hitObject.removeNode()
+                self.remeshChunks(self.world.removeBlock(cell))
 
     def placeBlock(self):
-        if self.rayQueue.getNumEntries() > 0:
-            self.rayQueue.sortEntries()
-            rayHit = self.rayQueue.getEntry(0)
-            hitNodePath = rayHit.getIntoNodePath()
-            normal = rayHit.getSurfaceNormal(hitNodePath)
-            hitObject = hitNodePath.getPythonTag('owner')
-            distanceFromPlayer = hitObject.getDistance(self.camera)
+        hit = self.lookedAtBlock()
+        if hit is not None:
+            cell, normal, distanceFromPlayer = hit
 
             if distanceFromPlayer < 14:
-                hitBlockPos = hitObject.getPos()
-                newBlockPos = hitBlockPos + normal * 2
-                self.createNewBlock(newBlockPos.x, newBlockPos.y, newBlockPos.z, self.selectedBlockType)
-    
+                newCell = tuple(c + n for c, n in zip(cell, normal))
+                self.remeshChunks(self.world.placeBlock(newCell, BLOCK_IDS[self.selectedBlockType]))
+
     def updateKeyMap(self, key, value):
         self.keyMap[key] = value
 
@@ -176,7 +204,8 @@ class MyGame(ShowBase):
 
     def setupCamera(self):
         self.disableMouse()
-        self.camera.setPos(0, 0, 3)
+        # Start just above the ground at the origin
+        self.camera.setPos(0, 0, (self.terrain.heightAt(0, 0) + 2) * BLOCK_SIZE)
         self.camLens.setFov(80)
 
         crosshairs = OnscreenImage(
@@ -186,14 +215,9 @@ class MyGame(ShowBase):
         )
         crosshairs.setTransparency(TransparencyAttrib.MAlpha)
 
-        self.cTrav = CollisionTraverser()
-        ray = CollisionRay()
-        ray.setFromLens(self.camNode, (0, 0))
-        rayNode = CollisionNode('line-of-sight')
-        rayNode.addSolid(ray)
-        rayNodePath = self.camera.attachNewNode(rayNode)
-        self.rayQueue = CollisionHandlerQueue()
-        self.cTrav.addCollider(rayNodePath, self.rayQueue)
+        # Line of sight is traced through the voxel grid (see lookedAtBlock),
+        # far enough to reach any block whose center is within place range
+        self.reachDistance = 14 + BLOCK_SIZE
 
     def setupSkybox(self):
         skybox = loader.loadModel('skybox/skybox.egg')
@@ -204,41 +228,95 @@ class MyGame(ShowBase):
         skybox.reparentTo(render)
     
     def generateTerrain(self):
-        for z in range(10):
-            for y in range(20):
-                for x in range(20):
-                    self.createNewBlock(
-                        x * 2 - 20,
-                        y * 2 - 20,
-                        -z * 2,
-                        'grass' if z == 0 else 'dirt'
-                    )
-
-
-    def createNewBlock(self, x, y, z, type):
-        newBlockNode = render.attachNewNode('new-block-placeholder')
-        newBlockNode.setPos(x, y, z)
-
-        if type == 'grass':
-            self.grassBlock.instanceTo(newBlockNode)
-        elif type == 'dirt':
-            self.dirtBlock.instanceTo(newBlockNode)
-        elif type == 'sand':
-            self.sandBlock.instanceTo(newBlockNode)
-        elif type == 'stone':
-            self.stoneBlock.instanceTo(newBlockNode)
-
-        blockSolid = CollisionBox((-1, -1, -1), (1, 1, 1))
-        blockNode = CollisionNode('block-collision-node')
-        blockNode.addSolid(blockSolid)
-        collider = newBlockNode.attachNewNode(blockNode)
-        collider.setPythonTag('owner', newBlockNode)
+        # Seeded hills (see terraingen.py), streamed in around the camera as
+        # it moves
+        self.store = RegionStore(SAVE_DIR)
+        self.streamer = ChunkStreamer(self.world, self.terrain, VIEW_RADIUS, store=self.store)
+
+    def saveWorld(self):
+        # Only chunks edited since the last save are written
+        self.store.save(self.world)
+
+    def userExit(self):
+        self.saveWorld()
+        ShowBase.userExit(self)
+
+    def streamChunks(self, task):
+        cameraPos = self.camera.getPos(render)
+        changed, unloaded = self.streamer.update(cameraPos)
+        self.remeshChunks(changed)
+        if self.lodCameraPos is None or (cameraPos - self.lodCameraPos).length() > BLOCK_SIZE:
+            self.lodCameraPos = cameraPos
+            self.updateLods()
+        for key in unloaded:
+            self.chunkLods.pop(key, None)
+            chunkNode = self.chunkNodes.pop(key, None)
+            if chunkNode is not None:
+                chunkNode.removeNode()
+            self.culler.forget(key)
+        return task.cont
+
+    def remeshChunks(self, keys):
+        # Only the edited chunk, and neighbors when the cell is on a border
+        for key in keys:
+            lod = self.chunkLods.get(key)
+            if lod is None:
+                lod = self.chunkLods[key] = chooseLod(self.chunkDistance(key))
+            self.mesher.request(key, lod)
+
+    def chunkDistance(self, key):
+        center = Vec3(*[(c * CHUNK_SIZE - 0.5) * BLOCK_SIZE + CHUNK_SIZE * BLOCK_SIZE / 2 for c in key])
+        return (center - self.camera.getPos(render)).length()
+
+    def updateLods(self):
+        # Distant chunks are re-meshed with merged blocks, near ones at full
+        # detail, so the vertex count stays roughly flat as the view grows
+        for key, lod in self.chunkLods.items():
+            newLod = chooseLod(self.chunkDistance(key), lod)
+            if newLod != lod:
+                self.chunkLods[key] = newLod
+                self.mesher.request(key, newLod)
+
+    def swapChunkMeshes(self, task):
+        # Swap meshes finished on the mesher thread into their chunk nodes.
+        # Replacing the Geom inside an existing GeomNode happens within one
+        # frame, so an edited chunk never shows up half-built or missing.
+        for key, lod, geom, connectivity in self.mesher.finished():
+            # A mesh for a level of detail the chunk has since left, or for a
+            # chunk streamChunks has unloaded (and the culler forgotten)
+            if lod != self.chunkLods.get(key):
+                continue
+            self.culler.setConnectivity(key, connectivity)
+            chunkNode = self.chunkNodes.get(key)
+            if geom is None:
+                if chunkNode is not None:
+                    chunkNode.removeNode()
+                    del self.chunkNodes[key]
+                    self.culler.hidden.discard(key)
+            elif chunkNode is None:
+                geomNode = GeomNode('chunk-%d-%d-%d' % key)
+                geomNode.addGeom(geom)
+                chunkNode = self.terrainRoot.attachNewNode(geomNode)
+                chunkNode.setPos(*[(c * CHUNK_SIZE - 0.5) * BLOCK_SIZE for c in key])
+                self.chunkNodes[key] = chunkNode
+            else:
+                chunkNode.node().setGeom(0, geom)
+        return task.cont
+
+    def cullChunks(self, task):
+        # Only chunks the camera can see through air stay in the scene graph;
+        # self.culler.stats has the counts (also sent to PStats)
+        frustum = self.camLens.makeBounds()
+        frustum.xform(self.cam.getMat(render))
+        cameraKey = tuple(c >> CHUNK_SHIFT for c in cellAt(*self.camera.getPos(render)))
+        self.culler.update(self.chunkNodes, cameraKey, frustum)
+        return task.cont
 
     def loadModels(self):
-        self.grassBlock = loader.loadModel('grass-block.glb')
-        self.dirtBlock = loader.loadModel('dirt-block.glb')
-        self.stoneBlock = loader.loadModel('stone-block.glb')
-        self.sandBlock = loader.loadModel('sand-block.glb')
+        # The four glb block models are only read for their textures, which
+        # go into one texture array shared by every chunk (see blockatlas.py)
+        self.blockTextures = loadBlockTextures(loader)
+        applyBlockState(self.terrainRoot, self.blockTextures)
 
     def setupLights(self):
         mainLight = DirectionalLight('main light')
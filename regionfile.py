@@ -0,0 +1,231 @@
+# On-disk storage for edited voxel chunks. Chunks are grouped into regions of
+# REGION_SIZE^3 chunks, one file per region:
+#
+#   b"VXR" + version byte
+#   offset table: REGION_SIZE^3 entries of (offset, size) as uint32, in
+#                 (x, y, z) order; size 0 means the chunk is not stored
+#   records: run count (uint16), then runs of (length uint16, block ID uint8)
+#            over the chunk's blocks in C order
+#
+# Terrain is generated from its seed, so only chunks edited since they were
+# loaded are written, and save time follows the number of edits rather than
+# the size of the world. Reads go through a memory map of the region file.
+
+import mmap
+import os
+import struct
+import threading
+
+import numpy as np
+
+from voxelworld import CHUNK_SIZE
+
+REGION_MAGIC = b"VXR"
+REGION_VERSION = 1
+REGION_SIZE = 8  # chunks per axis
+REGION_SHIFT = 3  # log2(REGION_SIZE)
+REGION_MASK = REGION_SIZE - 1
+
+_HEADER = struct.Struct("<3sB")
+_TABLE_DTYPE = np.dtype([("offset", "<u4"), ("size", "<u4")])
+_RUN_DTYPE = np.dtype([("length", "<u2"), ("blockId", "u1")])
+_COUNT = struct.Struct("<H")
+_TABLE_SIZE = REGION_SIZE ** 3 * _TABLE_DTYPE.itemsize
+
+
+def encodeChunk(blocks):
+    # Run-length encoding of the flattened block array
+    flat = blocks.ravel()
+    starts = np.flatnonzero(np.concatenate(([True], flat[1:] != flat[:-1])))
+    runs = np.empty(len(starts), dtype=_RUN_DTYPE)
+    runs["length"] = np.diff(np.append(starts, flat.size))
+    runs["blockId"] = flat[starts]
+    return _COUNT.pack(len(runs)) + runs.tobytes()
+
+
+def decodeChunk(data):
+    (count,) = _COUNT.unpack_from(data, 0)
+    runs = np.frombuffer(data, dtype=_RUN_DTYPE, count=count, offset=_COUNT.size)
+    return np.repeat(runs["blockId"], runs["length"]).reshape((CHUNK_SIZE,) * 3)
+
+
+def regionOf(key):
+    return (key[0] >> REGION_SHIFT, key[1] >> REGION_SHIFT, key[2] >> REGION_SHIFT)
+
+
+def slotOf(key):
+    return ((key[0] & REGION_MASK) * REGION_SIZE + (key[1] & REGION_MASK)) * REGION_SIZE + (key[2] & REGION_MASK)
+
+
+class RegionFile:
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            with open(path, "wb") as file:
+                file.write(_HEADER.pack(REGION_MAGIC, REGION_VERSION))
+                file.write(bytes(_TABLE_SIZE))
+        self.data = None
+        self.table = None
+        self.remap()
+
+    def remap(self):
+        if self.data is not None:
+            self.data.close()
+        with open(self.path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = _HEADER.unpack_from(self.data, 0)
+        if magic != REGION_MAGIC or version != REGION_VERSION:
+            raise ValueError("%s is not a region file" % self.path)
+        self.table = np.frombuffer(
+            self.data[_HEADER.size:_HEADER.size + _TABLE_SIZE], dtype=_TABLE_DTYPE
+        ).copy()
+
+    def keys(self, region):
+        # Keys of every chunk stored in this region
+        rx, ry, rz = region
+        keys = []
+        for slot in np.flatnonzero(self.table["size"]):
+            lx, rest = divmod(int(slot), REGION_SIZE * REGION_SIZE)
+            ly, lz = divmod(rest, REGION_SIZE)
+            keys.append((rx * REGION_SIZE + lx, ry * REGION_SIZE + ly, rz * REGION_SIZE + lz))
+        return keys
+
+    def read(self, key):
+        offset, size = self.table[slotOf(key)]
+        if not size:
+            return None
+        return decodeChunk(self.data[offset:offset + size])
+
+    def write(self, chunks):
+        # chunks: (key, blocks) pairs in this region. A record that fits in
+        # its old slot is rewritten in place; anything else is appended.
+        with open(self.path, "r+b") as file:
+            file.seek(0, os.SEEK_END)
+            end = file.tell()
+            for key, blocks in chunks:
+                record = encodeChunk(blocks)
+                slot = slotOf(key)
+                offset, size = self.table[slot]
+                if not size or len(record) > size:
+                    offset = end
+                    end += len(record)
+                file.seek(offset)
+                file.write(record)
+                self.table[slot] = (offset, len(record))
+            file.seek(_HEADER.size)
+            file.write(self.table.tobytes())
+        self.remap()
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+
+class RegionStore:
+    # The region files of one world. Safe to read from the chunk streamer's
+    # thread while the main thread saves.
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.files = {}
+        self.lock = threading.Lock()
+        # Regions on disk, so columns with no saved chunks never open a file
+        self.regions = set()
+        for name in os.listdir(directory):
+            parts = name.split(".")
+            if len(parts) == 5 and parts[0] == "r" and parts[4] == "region":
+                self.regions.add(tuple(int(p) for p in parts[1:4]))
+
+    def regionFile(self, region):
+        regionFile = self.files.get(region)
+        if regionFile is None:
+            path = os.path.join(self.directory, "r.%d.%d.%d.region" % region)
+            regionFile = self.files[region] = RegionFile(path)
+            self.regions.add(region)
+        return regionFile
+
+    def loadChunk(self, key):
+        region = regionOf(key)
+        with self.lock:
+            if region not in self.regions:
+                return None
+            return self.regionFile(region).read(key)
+
+    def loadColumn(self, ci, cj):
+        # Every saved chunk of a chunk column as (key, blocks) pairs
+        rx, ry = ci >> REGION_SHIFT, cj >> REGION_SHIFT
+        chunks = []
+        with self.lock:
+            for region in self.regions:
+                if region[0] != rx or region[1] != ry:
+                    continue
+                regionFile = self.regionFile(region)
+                for key in regionFile.keys(region):
+                    if key[0] == ci and key[1] == cj:
+                        chunks.append((key, regionFile.read(key)))
+        return chunks
+
+    def save(self, world, keys=None):
+        # Writes the world's dirty chunks (or only the dirty ones among keys)
+        # and returns how many were written
+        dirty = world.dirty if keys is None else world.dirty.intersection(keys)
+        byRegion = {}
+        for key in dirty:
+            chunk = world.chunks.get(key)
+            if chunk is not None:
+                byRegion.setdefault(regionOf(key), []).append((key, chunk.blocks))
+        with self.lock:
+            for region, chunks in byRegion.items():
+                self.regionFile(region).write(chunks)
+        count = len(dirty)
+        world.dirty.difference_update(list(dirty))
+        return count
+
+    def close(self):
+        with self.lock:
+            for regionFile in self.files.values():
+                regionFile.close()
+            self.files.clear()
+
+
+def benchmark(edits=1000, seed=0):
+    # Saves a 256x256 world after scattered edits, then reads it back
+    import random
+    import shutil
+    import tempfile
+    import time
+
+    from terraingen import TerrainGenerator
+    from voxelworld import VoxelWorld
+
+    world = VoxelWorld()
+    TerrainGenerator(seed).generate(world, (0, 0), (256, 256))
+    rng = random.Random(seed)
+    for _ in range(edits):
+        world.setBlock(rng.randrange(256), rng.randrange(256), rng.randrange(-16, 16), 0)
+
+    directory = tempfile.mkdtemp()
+    try:
+        store = RegionStore(directory)
+        dirty = set(world.dirty)
+        start = time.perf_counter()
+        count = store.save(world)
+        saveTime = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(directory, n)) for n in os.listdir(directory))
+        store.close()
+
+        store = RegionStore(directory)
+        start = time.perf_counter()
+        for key in dirty:
+            store.loadChunk(key)
+        loadTime = time.perf_counter() - start
+        store.close()
+        print("%d edits: %d of %d chunks saved in %.1f ms (%d bytes), loaded in %.1f ms" % (
+            edits, count, len(world.chunks), saveTime * 1000, size, loadTime * 1000))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,189 @@
+# Seeded terrain for the voxel world. Column heights come from fractal value
+# noise evaluated with NumPy over whole chunk columns at once, and a second
+# noise field picks dry areas, so a column's blocks follow from its height:
+#
+#   sand    beaches up to SAND_LEVEL and dry areas
+#   grass   the usual surface, with DIRT_DEPTH blocks of dirt below it
+#   stone   peaks above STONE_LEVEL and everything deeper down
+#
+# The same seed always gives the same world. Run this file for a headless
+# benchmark.
+
+import numpy as np
+
+from voxelworld import AIR, BLOCK_IDS, CHUNK_SHIFT, CHUNK_SIZE
+
+SEA_LEVEL = 0
+SAND_LEVEL = SEA_LEVEL + 1
+STONE_LEVEL = 12
+DIRT_DEPTH = 3
+BOTTOM = -16  # lowest cell generated; nothing exists below it
+
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def latticeHash(i, j, seed):
+    # Integer lattice points -> uniform floats in [-1, 1). Arithmetic is in
+    # uint64 truncated to 32 bits so it wraps the same way on every platform.
+    h = (i.astype(np.uint64) * np.uint64(374761393)
+         + j.astype(np.uint64) * np.uint64(668265263)
+         + np.uint64(seed * 2246822519 & 0xFFFFFFFF)) & _MASK32
+    h = ((h ^ (h >> np.uint64(13))) * np.uint64(1274126177)) & _MASK32
+    h ^= h >> np.uint64(16)
+    return h.astype(np.float64) * (2.0 / 2 ** 32) - 1.0
+
+
+def valueNoise(i, j, frequency, seed):
+    # i and j are 1-D cell coordinates; returns a (len(i), len(j)) grid of
+    # smoothly interpolated lattice values
+    x = i * frequency
+    y = j * frequency
+    x0 = np.floor(x)
+    y0 = np.floor(y)
+    tx = x - x0
+    ty = y - y0
+    tx = (tx * tx * (3 - 2 * tx))[:, None]
+    ty = (ty * ty * (3 - 2 * ty))[None, :]
+    xi = x0.astype(np.int64)[:, None]
+    yi = y0.astype(np.int64)[None, :]
+
+    c00 = latticeHash(xi, yi, seed)
+    c10 = latticeHash(xi + 1, yi, seed)
+    c01 = latticeHash(xi, yi + 1, seed)
+    c11 = latticeHash(xi + 1, yi + 1, seed)
+    top = c00 + (c10 - c00) * tx
+    bottom = c01 + (c11 - c01) * tx
+    return top + (bottom - top) * ty
+
+
+def fractalNoise(i, j, scale, octaves, seed):
+    # Octaves of value noise, each at twice the frequency and half the
+    # amplitude of the last, normalized back to about [-1, 1]
+    total = np.zeros((len(i), len(j)))
+    amplitude = 1.0
+    frequency = 1.0 / scale
+    norm = 0.0
+    for octave in range(octaves):
+        total += amplitude * valueNoise(i, j, frequency, seed + octave * 1013)
+        norm += amplitude
+        amplitude *= 0.5
+        frequency *= 2
+    return total / norm
+
+
+class TerrainGenerator:
+    def __init__(self, seed=0, scale=48.0, octaves=4, baseHeight=4, amplitude=14):
+        self.seed = seed
+        self.baseHeight = baseHeight
+        self.scale = scale
+        self.octaves = octaves
+        self.amplitude = amplitude
+
+    def heightmap(self, i0, j0, width, depth):
+        # Surface cell height (k of the top block) for every column in the
+        # width x depth area starting at cell (i0, j0)
+        i = np.arange(i0, i0 + width, dtype=np.float64)
+        j = np.arange(j0, j0 + depth, dtype=np.float64)
+        heights = fractalNoise(i, j, self.scale, self.octaves, self.seed)
+        heights = np.rint(self.baseHeight + heights * self.amplitude).astype(np.int32)
+        return np.maximum(heights, BOTTOM)
+
+    def surfaceTypes(self, i0, j0, heights):
+        # Block ID of the top block of every column in the heightmap
+        width, depth = heights.shape
+        i = np.arange(i0, i0 + width, dtype=np.float64)
+        j = np.arange(j0, j0 + depth, dtype=np.float64)
+        dryness = fractalNoise(i, j, self.scale * 2, 2, self.seed + 7919)
+        surface = np.full(heights.shape, BLOCK_IDS['grass'], dtype=np.uint8)
+        surface[(heights <= SAND_LEVEL) | (dryness > 0.4)] = BLOCK_IDS['sand']
+        surface[heights >= STONE_LEVEL] = BLOCK_IDS['stone']
+        return surface
+
+    def heightAt(self, i, j):
+        return int(self.heightmap(i, j, 1, 1)[0, 0])
+
+    def columnBlocks(self, heights, surface, k0, size):
+        # Block IDs for cells k0 .. k0 + size - 1 of every column
+        k = np.arange(k0, k0 + size, dtype=np.int32)[None, None, :]
+        depth = heights[:, :, None] - k  # 0 at the surface, growing downwards
+        under = np.where(surface == BLOCK_IDS['grass'], BLOCK_IDS['dirt'], surface)
+        blocks = np.full(depth.shape, BLOCK_IDS['stone'], dtype=np.uint8)
+        shallow = depth <= DIRT_DEPTH
+        blocks = np.where(shallow, under[:, :, None], blocks)
+        blocks = np.where(depth == 0, surface[:, :, None], blocks)
+        blocks[(depth < 0) | (k < BOTTOM)] = AIR
+        return blocks
+
+    def generateChunk(self, key):
+        # The chunk's blocks as a CHUNK_SIZE^3 uint8 array, or None when the
+        # chunk is all air
+        ci, cj, ck = key
+        k0 = ck * CHUNK_SIZE
+        if k0 + CHUNK_SIZE <= BOTTOM:
+            return None
+        i0, j0 = ci * CHUNK_SIZE, cj * CHUNK_SIZE
+        heights = self.heightmap(i0, j0, CHUNK_SIZE, CHUNK_SIZE)
+        if heights.max() < k0:
+            return None
+        surface = self.surfaceTypes(i0, j0, heights)
+        return self.columnBlocks(heights, surface, k0, CHUNK_SIZE)
+
+    def chunkRange(self, heights):
+        # Vertical chunk keys a column of chunks with these heights occupies
+        return range(BOTTOM >> CHUNK_SHIFT, (int(heights.max()) >> CHUNK_SHIFT) + 1)
+
+    def generateColumn(self, ci, cj, outside=None):
+        # Every non-empty chunk of the chunk column (ci, cj) as (key, blocks)
+        # pairs. The noise is computed once for the whole column. Columns
+        # flagged in the optional outside mask are left empty.
+        i0, j0 = ci * CHUNK_SIZE, cj * CHUNK_SIZE
+        heights = self.heightmap(i0, j0, CHUNK_SIZE, CHUNK_SIZE)
+        surface = self.surfaceTypes(i0, j0, heights)
+        chunks = []
+        for ck in self.chunkRange(heights):
+            blocks = self.columnBlocks(heights, surface, ck * CHUNK_SIZE, CHUNK_SIZE)
+            if outside is not None:
+                blocks[outside] = AIR
+            if blocks.any():
+                chunks.append(((ci, cj, ck), blocks))
+        return chunks
+
+    def generate(self, world, low, high):
+        # Fills every column with low <= (i, j) < high into the world and
+        # returns the keys of the chunks written
+        touched = []
+        for ci in range(low[0] >> CHUNK_SHIFT, ((high[0] - 1) >> CHUNK_SHIFT) + 1):
+            for cj in range(low[1] >> CHUNK_SHIFT, ((high[1] - 1) >> CHUNK_SHIFT) + 1):
+                i0, j0 = ci * CHUNK_SIZE, cj * CHUNK_SIZE
+                outside = np.ones((CHUNK_SIZE, CHUNK_SIZE), dtype=bool)
+                outside[
+                    max(low[0] - i0, 0):min(high[0] - i0, CHUNK_SIZE),
+                    max(low[1] - j0, 0):min(high[1] - j0, CHUNK_SIZE),
+                ] = False
+                for key, blocks in self.generateColumn(ci, cj, outside):
+                    world.setChunkBlocks(key, blocks)
+                    touched.append(key)
+        return touched
+
+
+def benchmark(size=256, seed=0):
+    import time
+
+    from voxelworld import VoxelWorld
+
+    generator = TerrainGenerator(seed)
+    start = time.perf_counter()
+    generator.heightmap(0, 0, size, size)
+    heightmapTime = time.perf_counter() - start
+
+    world = VoxelWorld()
+    start = time.perf_counter()
+    chunks = generator.generate(world, (0, 0), (size, size))
+    elapsed = time.perf_counter() - start
+    print("%dx%d heightmap %.1f ms" % (size, size, heightmapTime * 1000))
+    print("%dx%d world: %d chunks, %d blocks in %.1f ms" % (
+        size, size, len(chunks), world.blockCount, elapsed * 1000))
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,220 @@
+# Greedy meshing of voxel chunks. Faces between two solid blocks are culled,
+# then coplanar faces of the same block type are merged into the largest
+# rectangles possible, so a chunk becomes one Geom whose size follows its
+# visible surface rather than its block count. Vertices carry a texture
+# coordinate in blocks plus the block face's layer in the block texture
+# array (see blockatlas.py), so textures repeat once per block.
+#
+# Distant chunks are meshed at a lower level of detail: every 2x2x2 or 4x4x4
+# group of blocks becomes one block of the group's most common type (air
+# when less than half of it is solid). Neighboring chunks at different
+# levels are not stitched, which can leave small gaps at their borders.
+
+import queue
+import threading
+
+import numpy as np
+
+from panda3d.core import (
+    Geom,
+    GeomTriangles,
+    GeomVertexArrayFormat,
+    GeomVertexData,
+    GeomVertexFormat,
+)
+
+from chunkculler import faceConnectivity
+from blockatlas import BOTTOM, SIDE, TOP, blockLayer
+from voxelworld import BLOCK_SIZE, BLOCK_TYPES
+
+_arrayFormat = GeomVertexArrayFormat()
+_arrayFormat.addColumn("vertex", 3, Geom.NTFloat32, Geom.CPoint)
+_arrayFormat.addColumn("normal", 3, Geom.NTFloat32, Geom.CNormal)
+_arrayFormat.addColumn("texcoord", 3, Geom.NTFloat32, Geom.CTexcoord)
+VERTEX_FORMAT = GeomVertexFormat.registerFormat(GeomVertexFormat(_arrayFormat))
+VERTEX_DTYPE = np.dtype([("vertex", "<f4", 3), ("normal", "<f4", 3), ("texcoord", "<f4", 3)])
+
+# Block merge factor per level of detail, and the camera distance (world
+# units) past which each coarser level is used. A chunk only switches once
+# it is LOD_HYSTERESIS beyond a threshold, so it does not flicker between
+# levels while the camera hovers around it.
+LOD_FACTORS = (1, 2, 4)
+LOD_DISTANCES = (80, 160)
+LOD_HYSTERESIS = 12
+
+
+def chooseLod(distance, current=0):
+    lod = current
+    while lod + 1 < len(LOD_FACTORS) and distance > LOD_DISTANCES[lod] + LOD_HYSTERESIS:
+        lod += 1
+    while lod > 0 and distance < LOD_DISTANCES[lod - 1] - LOD_HYSTERESIS:
+        lod -= 1
+    return lod
+
+
+def downsample(padded, factor):
+    # Merges factor^3 groups of blocks; padded must have a border of factor
+    # cells so the result has the usual one-cell border
+    if factor == 1:
+        return padded
+    m = padded.shape[0] // factor
+    groups = padded.reshape(m, factor, m, factor, m, factor).transpose(0, 2, 4, 1, 3, 5).reshape(m, m, m, -1)
+    counts = np.stack([(groups == blockId).sum(axis=3) for blockId in range(1, len(BLOCK_TYPES) + 1)], axis=3)
+    coarse = (counts.argmax(axis=3) + 1).astype(np.uint8)
+    coarse[counts.sum(axis=3) * 2 < factor ** 3] = 0
+    return coarse
+
+
+def greedyQuads(padded):
+    # padded is an (n + 2)^3 block array with a one-cell border from the
+    # neighbor chunks. Yields (axis, sign, quads) where every quad row is
+    # (layer, u, v, du, dv, blockId) and u, v run along the other two axes in
+    # increasing order.
+    n = padded.shape[0] - 2
+    inner = padded[1:-1, 1:-1, 1:-1]
+    for axis in range(3):
+        for sign in (1, -1):
+            ahead = [slice(1, -1)] * 3
+            ahead[axis] = slice(2, None) if sign > 0 else slice(None, -2)
+            visible = (inner != 0) & (padded[tuple(ahead)] == 0)
+            faces = np.moveaxis(np.where(visible, inner, 0), axis, 0)
+
+            quads = []
+            for layer in np.flatnonzero(faces.reshape(n, -1).any(axis=1)):
+                mask = faces[layer].tolist()
+                for u in range(n):
+                    row = mask[u]
+                    v = 0
+                    while v < n:
+                        blockId = row[v]
+                        if not blockId:
+                            v += 1
+                            continue
+                        width = 1
+                        while v + width < n and row[v + width] == blockId:
+                            width += 1
+                        segment = row[v:v + width]
+                        height = 1
+                        while u + height < n and mask[u + height][v:v + width] == segment:
+                            height += 1
+                        cleared = [0] * width
+                        for du in range(height):
+                            mask[u + du][v:v + width] = cleared
+                        quads.append((layer, u, v, height, width, blockId))
+                        v += width
+            if quads:
+                yield axis, sign, np.array(quads, dtype=np.int32)
+
+
+def buildVertices(padded, scale=1):
+    # Greedy quads -> (vertex array, triangle index array) in chunk-local
+    # world units, each cell of padded being scale blocks wide. Pure NumPy,
+    # so it can run off the main thread.
+    groups = []
+    for axis, sign, quads in greedyQuads(padded):
+        uAxis, vAxis = [a for a in range(3) if a != axis]
+        layer, u, v, du, dv, blockId = quads.T
+        count = len(quads)
+
+        corners = np.empty((count, 4, 3), dtype=np.float32)
+        corners[:, :, axis] = (layer + (sign > 0))[:, None]
+        corners[:, :, uAxis] = np.stack([u, u + du, u + du, u], axis=1)
+        corners[:, :, vAxis] = np.stack([v, v, v + dv, v + dv], axis=1)
+        # Corners run counter-clockwise around u x v, which points along +axis
+        # except for the y axis (x cross z is -y); reverse when that faces away
+        if (sign > 0) != (axis != 1):
+            corners = corners[:, ::-1]
+
+        normal = [0.0, 0.0, 0.0]
+        normal[axis] = float(sign)
+        vertices = np.empty((count, 4), dtype=VERTEX_DTYPE)
+        vertices["vertex"] = corners * (BLOCK_SIZE * scale)
+        vertices["normal"] = normal
+        # Texture u runs to the right as seen from outside the face, v up the
+        # side faces
+        flipU = -1 if (axis == 0 and sign < 0) or (axis == 1 and sign > 0) else 1
+        face = SIDE if axis != 2 else TOP if sign > 0 else BOTTOM
+        vertices["texcoord"][:, :, 0] = corners[:, :, uAxis] * (scale * flipU)
+        vertices["texcoord"][:, :, 1] = corners[:, :, vAxis] * scale
+        vertices["texcoord"][:, :, 2] = blockLayer(blockId, face)[:, None]
+        groups.append(vertices.reshape(-1))
+
+    if not groups:
+        return None, None
+    vertices = np.concatenate(groups)
+    first = np.arange(0, len(vertices), 4, dtype=np.uint32)[:, None]
+    indices = (first + np.array([0, 1, 2, 0, 2, 3], dtype=np.uint32)).reshape(-1)
+    return vertices, indices
+
+
+def buildGeom(vertices, indices, name="chunk"):
+    vdata = GeomVertexData(name, VERTEX_FORMAT, Geom.UHStatic)
+    vdata.uncleanSetNumRows(len(vertices))
+    memoryview(vdata.modifyArray(0)).cast("B")[:] = vertices.tobytes()
+
+    triangles = GeomTriangles(Geom.UHStatic)
+    triangles.setIndexType(Geom.NTUint32)
+    handle = triangles.modifyVertices()
+    handle.uncleanSetNumRows(len(indices))
+    memoryview(handle).cast("B")[:] = indices.tobytes()
+
+    geom = Geom(vdata)
+    geom.addPrimitive(triangles)
+    return geom
+
+
+class ChunkMesher:
+    # Re-meshes chunks on a worker thread. request() only queues a chunk key;
+    # the worker snapshots the chunk, runs the greedy mesher and builds a
+    # detached Geom at the requested level of detail, along with the chunk's
+    # face connectivity for culling. finished() hands completed geoms back to
+    # the main thread, dropping any built from a chunk that has been edited
+    # again since.
+    def __init__(self, world):
+        self.world = world
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.queued = set()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.work, name="chunk-mesher", daemon=True)
+        self.thread.start()
+
+    def request(self, key, lod=0):
+        with self.lock:
+            if (key, lod) in self.queued:
+                return
+            self.queued.add((key, lod))
+        self.requests.put((key, lod))
+
+    def work(self):
+        while True:
+            key, lod = self.requests.get()
+            with self.lock:
+                self.queued.discard((key, lod))
+            chunk = self.world.chunks.get(key)
+            version = chunk.version if chunk is not None else None
+            factor = LOD_FACTORS[lod]
+            padded = self.world.paddedBlocks(key, factor)
+            vertices, indices = buildVertices(downsample(padded, factor), factor)
+            geom = None
+            if vertices is not None:
+                geom = buildGeom(vertices, indices, "chunk-%d-%d-%d" % key)
+            connectivity = faceConnectivity(padded[factor:-factor, factor:-factor, factor:-factor])
+            self.results.put((key, lod, version, geom, connectivity))
+            self.requests.task_done()
+
+    def finished(self):
+        # Yields (key, lod, geom or None, face connectivity) for every
+        # up-to-date mesh built so far
+        while True:
+            try:
+                key, lod, version, geom, connectivity = self.results.get_nowait()
+            except queue.Empty:
+                return
+            chunk = self.world.chunks.get(key)
+            if (chunk.version if chunk is not None else None) == version:
+                yield key, lod, geom, connectivity
+
+    def idle(self):
+        # True once every requested chunk has been meshed
+        return self.requests.unfinished_tasks == 0
@@ -0,0 +1,102 @@
+# Amanatides-Woo grid traversal over a VoxelWorld: steps from cell to cell
+# along a ray and stops at the first solid block, without any collision
+# solids or scene graph. Run this file for a headless benchmark.
+
+from math import floor, inf, sqrt
+
+from voxelworld import BLOCK_SIZE, CHUNK_MASK, CHUNK_SHIFT
+
+
+def raycast(world, origin, direction, maxDistance):
+    # origin and direction are in world units. Returns (cell, normal,
+    # distance) for the first solid block within maxDistance, where normal is
+    # the face the ray entered through, or None. The block containing the
+    # origin itself is skipped.
+    dx, dy, dz = direction
+    length = sqrt(dx * dx + dy * dy + dz * dz)
+    if length == 0:
+        return None
+    dx, dy, dz = dx / length, dy / length, dz / length
+
+    # Cell i spans world [i * BLOCK_SIZE - 1, i * BLOCK_SIZE + 1]; work in
+    # units where it spans [i, i + 1)
+    ux = (origin[0] + BLOCK_SIZE / 2) / BLOCK_SIZE
+    uy = (origin[1] + BLOCK_SIZE / 2) / BLOCK_SIZE
+    uz = (origin[2] + BLOCK_SIZE / 2) / BLOCK_SIZE
+    x, y, z = floor(ux), floor(uy), floor(uz)
+
+    # Per axis: step direction, world distance to the first boundary and
+    # world distance between boundaries
+    stepX = 1 if dx > 0 else -1
+    stepY = 1 if dy > 0 else -1
+    stepZ = 1 if dz > 0 else -1
+    deltaX = BLOCK_SIZE / abs(dx) if dx else inf
+    deltaY = BLOCK_SIZE / abs(dy) if dy else inf
+    deltaZ = BLOCK_SIZE / abs(dz) if dz else inf
+    nextX = ((x + 1 - ux) if dx > 0 else (ux - x)) * deltaX if dx else inf
+    nextY = ((y + 1 - uy) if dy > 0 else (uy - y)) * deltaY if dy else inf
+    nextZ = ((z + 1 - uz) if dz > 0 else (uz - z)) * deltaZ if dz else inf
+
+    chunks = world.chunks
+    chunkKey = None
+    blocks = None
+    while True:
+        if nextX < nextY and nextX < nextZ:
+            distance = nextX
+            x += stepX
+            nextX += deltaX
+            normal = (-stepX, 0, 0)
+        elif nextY < nextZ:
+            distance = nextY
+            y += stepY
+            nextY += deltaY
+            normal = (0, -stepY, 0)
+        else:
+            distance = nextZ
+            z += stepZ
+            nextZ += deltaZ
+            normal = (0, 0, -stepZ)
+        if distance > maxDistance:
+            return None
+
+        # Chunk lookups are only repeated when the ray crosses into a new chunk
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+        if key != chunkKey:
+            chunkKey = key
+            chunk = chunks.get(key)
+            blocks = chunk.blocks if chunk is not None else None
+        if blocks is not None and blocks[x & CHUNK_MASK, y & CHUNK_MASK, z & CHUNK_MASK]:
+            return (x, y, z), normal, distance
+
+
+def benchmark(rays=100000, seed=0):
+    # Rays from random points above the default 20x20x10 terrain, looking
+    # down at random angles
+    import random
+    import time
+
+    from voxelworld import BLOCK_IDS, VoxelWorld
+
+    world = VoxelWorld()
+    world.fillBox((-10, -10, -9), (10, 10, 0), BLOCK_IDS['dirt'])
+    world.fillBox((-10, -10, 0), (10, 10, 1), BLOCK_IDS['grass'])
+
+    rng = random.Random(seed)
+    cases = [
+        (
+            (rng.uniform(-20, 20), rng.uniform(-20, 20), rng.uniform(3, 10)),
+            (rng.uniform(-1, 1), rng.uniform(-1, 1), rng.uniform(-1, -0.1)),
+        )
+        for _ in range(rays)
+    ]
+    start = time.perf_counter()
+    hits = 0
+    for origin, direction in cases:
+        if raycast(world, origin, direction, 14) is not None:
+            hits += 1
+    elapsed = time.perf_counter() - start
+    print("%d rays, %d hits, %.2f us per ray" % (rays, hits, elapsed / rays * 1e6))
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,177 @@
+# Chunked voxel storage for the block world in main.py. Blocks sit on an
+# integer grid: cell (i, j, k) is the 2x2x2 block centered on world position
+# (2i, 2j, 2k), the same spacing generateTerrain has always used. Each chunk
+# holds a CHUNK_SIZE^3 uint8 array of block IDs, 0 being air.
+#
+# The world is the only record of which blocks exist: a hash of chunk keys to
+# arrays, so any cell is found in O(1) without touching the scene graph.
+
+import numpy as np
+
+BLOCK_SIZE = 2
+CHUNK_SIZE = 16
+CHUNK_SHIFT = 4  # log2(CHUNK_SIZE)
+CHUNK_MASK = CHUNK_SIZE - 1
+
+AIR = 0
+BLOCK_TYPES = ("grass", "dirt", "sand", "stone")
+BLOCK_IDS = {name: index + 1 for index, name in enumerate(BLOCK_TYPES)}
+
+# Face directions shared by the mesher and the neighbor lookups
+DIRECTIONS = ((1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1))
+
+
+class Chunk:
+    def __init__(self, key, blocks=None):
+        self.key = key
+        if blocks is None:
+            blocks = np.zeros((CHUNK_SIZE,) * 3, dtype=np.uint8)
+        self.blocks = blocks
+        self.version = 0  # bumped on every edit so stale meshes can be spotted
+
+    def origin(self):
+        # Cell coordinates of the chunk's (0, 0, 0) corner
+        return tuple(c * CHUNK_SIZE for c in self.key)
+
+
+def cellAt(x, y, z):
+    # World position (a block center or any point inside the block) -> cell.
+    # Rounding keeps float noise from ever producing a second, offset cell.
+    return (
+        int(round(x / BLOCK_SIZE)),
+        int(round(y / BLOCK_SIZE)),
+        int(round(z / BLOCK_SIZE)),
+    )
+
+
+def cellCenter(i, j, k):
+    return (i * BLOCK_SIZE, j * BLOCK_SIZE, k * BLOCK_SIZE)
+
+
+class VoxelWorld:
+    def __init__(self):
+        self.chunks = {}
+        self.blockCount = 0
+        self.dirty = set()  # chunks edited since they were loaded or saved
+
+    def getChunk(self, key, create=False):
+        chunk = self.chunks.get(key)
+        if chunk is None and create:
+            chunk = self.chunks[key] = Chunk(key)
+        return chunk
+
+    def getBlock(self, i, j, k):
+        chunk = self.chunks.get((i >> CHUNK_SHIFT, j >> CHUNK_SHIFT, k >> CHUNK_SHIFT))
+        if chunk is None:
+            return AIR
+        return int(chunk.blocks[i & CHUNK_MASK, j & CHUNK_MASK, k & CHUNK_MASK])
+
+    def hasBlock(self, i, j, k):
+        return self.getBlock(i, j, k) != AIR
+
+    def neighbors(self, i, j, k):
+        # Solid blocks sharing a face with the cell, as (cell, blockId) pairs
+        found = []
+        for di, dj, dk in DIRECTIONS:
+            blockId = self.getBlock(i + di, j + dj, k + dk)
+            if blockId != AIR:
+                found.append(((i + di, j + dj, k + dk), blockId))
+        return found
+
+    def placeBlock(self, cell, blockId):
+        # Adds a block to an empty cell; an occupied cell is left untouched so
+        # blocks can never be duplicated. Returns the chunks to re-mesh.
+        if self.hasBlock(*cell):
+            return []
+        return self.setBlock(*cell, blockId)
+
+    def removeBlock(self, cell):
+        return self.setBlock(*cell, AIR)
+
+    def setBlock(self, i, j, k, blockId):
+        # Returns the keys of every chunk whose mesh the edit touches: its own,
+        # plus the neighbor across any chunk border the cell lies on
+        key = (i >> CHUNK_SHIFT, j >> CHUNK_SHIFT, k >> CHUNK_SHIFT)
+        chunk = self.getChunk(key, create=blockId != AIR)
+        if chunk is None:
+            return []
+        local = (i & CHUNK_MASK, j & CHUNK_MASK, k & CHUNK_MASK)
+        previous = int(chunk.blocks[local])
+        if previous == blockId:
+            return []
+        chunk.blocks[local] = blockId
+        chunk.version += 1
+        self.blockCount += (blockId != AIR) - (previous != AIR)
+        self.dirty.add(key)
+
+        touched = [key]
+        for axis in range(3):
+            if local[axis] == 0 or local[axis] == CHUNK_MASK:
+                neighbor = list(key)
+                neighbor[axis] += 1 if local[axis] else -1
+                if tuple(neighbor) in self.chunks:
+                    touched.append(tuple(neighbor))
+        return touched
+
+    def fillBox(self, low, high, blockId):
+        # Sets every cell with low <= cell < high (per axis) in bulk
+        touched = set()
+        for ci in range(low[0] >> CHUNK_SHIFT, ((high[0] - 1) >> CHUNK_SHIFT) + 1):
+            for cj in range(low[1] >> CHUNK_SHIFT, ((high[1] - 1) >> CHUNK_SHIFT) + 1):
+                for ck in range(low[2] >> CHUNK_SHIFT, ((high[2] - 1) >> CHUNK_SHIFT) + 1):
+                    chunk = self.getChunk((ci, cj, ck), create=True)
+                    origin = chunk.origin()
+                    region = tuple(
+                        slice(max(low[a] - origin[a], 0), min(high[a] - origin[a], CHUNK_SIZE))
+                        for a in range(3)
+                    )
+                    self.blockCount -= int(np.count_nonzero(chunk.blocks[region]))
+                    chunk.blocks[region] = blockId
+                    if blockId != AIR:
+                        self.blockCount += chunk.blocks[region].size
+                    chunk.version += 1
+                    touched.add(chunk.key)
+        self.dirty.update(touched)
+        return touched
+
+    def setChunkBlocks(self, key, blocks):
+        # Replaces a whole chunk with freshly generated or loaded blocks,
+        # which leaves it clean
+        chunk = self.getChunk(key, create=True)
+        self.dirty.discard(key)
+        self.blockCount += int(np.count_nonzero(blocks)) - int(np.count_nonzero(chunk.blocks))
+        chunk.blocks = blocks
+        chunk.version += 1
+        return chunk
+
+    def removeChunk(self, key):
+        # Drops a chunk and its blocks from memory; unsaved edits are lost
+        self.dirty.discard(key)
+        chunk = self.chunks.pop(key, None)
+        if chunk is not None:
+            self.blockCount -= int(np.count_nonzero(chunk.blocks))
+        return chunk
+
+    def paddedBlocks(self, key, border=1):
+        # The chunk's blocks with a border copied from the six face neighbors,
+        # so the mesher can cull faces across chunk borders
+        n = CHUNK_SIZE
+        b = border
+        padded = np.zeros((n + 2 * b,) * 3, dtype=np.uint8)
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            padded[b:-b, b:-b, b:-b] = chunk.blocks
+        ci, cj, ck = key
+        for axis in range(3):
+            for side, source, target in ((-1, slice(n - b, n), slice(0, b)), (1, slice(0, b), slice(n + b, None))):
+                neighborKey = [ci, cj, ck]
+                neighborKey[axis] += side
+                neighbor = self.chunks.get(tuple(neighborKey))
+                if neighbor is None:
+                    continue
+                into = [slice(b, -b)] * 3
+                into[axis] = target
+                take = [slice(None)] * 3
+                take[axis] = source
+                padded[tuple(into)] = neighbor.blocks[tuple(take)]
+        return padded